@@ -0,0 +1,114 @@
+"""Benchmark source deduplication on synthetic Tavily result sets.
+
+Each report is simulated as a batch of search responses where the same
+articles come back for several queries, with tracking parameters, AMP and
+mobile mirrors, http/https variants and syndicated copies on other sites.
+
+Run from the repository root:
+
+    python benchmarks/docgen/bench_dedup.py
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "code"))
+
+from docgen_agent import sources  # noqa: E402
+
+_VOCABULARY = (
+    "gpu cuda tensor core training inference memory bandwidth hbm nvlink "
+    "cluster model parameters throughput latency kernel precision fp8 bf16 "
+    "transformer attention batch scaling datacenter accelerator compiler "
+    "benchmark performance power efficiency cost cloud instance workload "
+    "distributed parallelism pipeline optimizer gradient checkpoint dataset"
+).split()
+_SITES = ["nvidia.com", "techcrunch.com", "arstechnica.com", "medium.com"]
+_MIRRORS = ["reuters.com", "yahoo.com", "msn.com", "newsbreak.com"]
+
+
+def _article(rng: random.Random, idx: int) -> dict:
+    words = [rng.choice(_VOCABULARY) for _ in range(rng.randint(60, 120))]
+    site = rng.choice(_SITES)
+    return {
+        "title": f"Article {idx}",
+        "url": f"https://www.{site}/posts/article-{idx}",
+        "content": " ".join(words),
+        "score": rng.random(),
+    }
+
+
+def _variant(rng: random.Random, article: dict) -> dict:
+    """Return the article as another query might see it."""
+    variant = dict(article)
+    url = article["url"]
+    kind = rng.randrange(6)
+    if kind == 1:
+        url += f"?utm_source=feed&utm_medium=rss&fbclid={rng.randrange(10**9)}"
+    elif kind == 2:
+        url = url.replace("https://www.", "https://amp.") + "/amp"
+    elif kind == 3:
+        url = url.replace("https://", "http://") + "/"
+    elif kind == 4:
+        mirror = rng.choice(_MIRRORS)
+        url = f"https://{mirror}/syndicated/{rng.randrange(10**6)}"
+        variant["content"] = f"{mirror.split('.')[0]} - " + article["content"]
+    elif kind == 5:
+        url = f"https://{rng.choice(_MIRRORS)}/story/{rng.randrange(10**6)}"
+    variant["url"] = url
+    return variant
+
+
+def _results(rng: random.Random, results: int, unique: int) -> list[dict]:
+    articles = [_article(rng, idx) for idx in range(unique)]
+    return [_variant(rng, rng.choice(articles)) for _ in range(results)]
+
+
+def _exact_url_dedup(results: list[dict]) -> list[dict]:
+    unique: dict[str, dict] = {}
+    for source in results:
+        unique.setdefault(source["url"], source)
+    return list(unique.values())
+
+
+def _tokens(results: list[dict]) -> int:
+    """Estimate prompt tokens the way the formatted sources are estimated."""
+    chars = sum(
+        len(source["title"]) + len(source["url"]) + len(source["content"]) + 80
+        for source in results
+    )
+    return chars // 4
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--results", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--unique-ratio", type=float, default=0.4)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(
+        f"{'results':>8} {'url only':>10} {'near dup':>10} "
+        f"{'tokens saved':>13} {'seconds':>8}"
+    )
+    for count in args.results:
+        rng = random.Random(args.seed)
+        results = _results(rng, count, max(1, int(count * args.unique_ratio)))
+
+        baseline_tokens = _tokens(_exact_url_dedup(results))
+        start = time.perf_counter()
+        unique = sources.deduplicate(results)
+        elapsed = time.perf_counter() - start
+        tokens = _tokens(unique)
+        saved = 1 - tokens / baseline_tokens
+        print(
+            f"{count:>8} {baseline_tokens:>10} {tokens:>10} "
+            f"{saved:>12.1%} {elapsed:>8.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
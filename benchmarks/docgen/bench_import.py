@@ -0,0 +1,135 @@
+"""Benchmark and guard the import time of the agent packages.
+
+Imports each package in a fresh interpreter under `python -X importtime`,
+and reports the median cumulative import time and the slowest modules.
+Heavy client libraries must not be imported until a client is first
+used, so a run fails if the import alone loads any of them, or if the
+median import time exceeds the budget.
+
+Run from the repository root:
+
+    python benchmarks/docgen/bench_import.py
+    python benchmarks/docgen/bench_import.py --repeat 10 --budget-ms 1500
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Any
+
+_ROOT = Path(__file__).resolve().parents[2]
+
+# The directory each package is imported from, and the modules it must not load.
+TARGETS = {
+    "docgen_agent": (
+        _ROOT / "code",
+        ["langchain_nvidia_ai_endpoints", "tavily", "aiosqlite"],
+    ),
+    "langgraph_cua": (
+        _ROOT / "langgraph-cua-py",
+        ["langchain_openai", "openai", "scrapybara"],
+    ),
+}
+
+# A plain import statement, so -X importtime writes a line for the package
+# itself and not only for its children.
+_PROBE = (
+    "import json, sys; "
+    "import {package}; "
+    "print(json.dumps(sorted(m for m in {heavy!r} if m in sys.modules)))"
+)
+
+
+def parse_importtime(stderr: str) -> dict[str, int]:
+    """Return the cumulative import time, in microseconds, of each module."""
+    cumulative: dict[str, int] = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative_us, name = line.removeprefix("import time:").split("|")
+        if cumulative_us.strip().isdigit():
+            cumulative[name.strip()] = int(cumulative_us)
+    return cumulative
+
+
+def run_once(package: str, path: Path, heavy: list[str]) -> dict[str, Any]:
+    """Import a package in a fresh interpreter and time it."""
+    pythonpath = [str(path), *filter(None, [os.getenv("PYTHONPATH")])]
+    proc = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            _PROBE.format(package=package, heavy=heavy),
+        ],
+        capture_output=True,
+        env={**os.environ, "PYTHONPATH": os.pathsep.join(pythonpath)},
+        text=True,
+    )
+    if proc.returncode:
+        return {"error": proc.stderr.strip().splitlines()[-1]}
+    cumulative = parse_importtime(proc.stderr)
+    return {
+        "total_ms": cumulative.get(package, 0) / 1000,
+        "modules": cumulative,
+        "heavy": json.loads(proc.stdout.strip().splitlines()[-1]),
+        "error": None,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--packages", default=",".join(TARGETS))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=2000.0)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    failed = False
+    results = {}
+    for package in args.packages.split(","):
+        path, heavy = TARGETS[package]
+        # The first import also compiles bytecode, so it is not timed.
+        runs = [run_once(package, path, heavy) for _ in range(args.repeat + 1)][1:]
+        errors = [run["error"] for run in runs if run["error"]]
+        if errors:
+            print(f"{package}: import failed: {errors[0]}")
+            failed = True
+            continue
+
+        total_ms = statistics.median(run["total_ms"] for run in runs)
+        loaded = sorted({module for run in runs for module in run["heavy"]})
+        slowest = sorted(
+            (
+                (statistics.median(run["modules"].get(name, 0) for run in runs), name)
+                for name in runs[-1]["modules"]
+                if name != package
+            ),
+            reverse=True,
+        )[: args.top]
+        results[package] = {"total_ms": total_ms, "heavy": loaded}
+
+        print(f"{package}: {total_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+        for cumulative_us, name in slowest:
+            print(f"  {cumulative_us / 1000:>8.1f} ms  {name}")
+        if loaded:
+            print(f"  loaded on import: {', '.join(loaded)}")
+            failed = True
+        if total_ms > args.budget_ms:
+            print("  over budget")
+            failed = True
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as output_file:
+            json.dump(results, output_file, indent=2)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Benchmark rendering search results into prompt text.
+
+Compares the old approach, which built the prompt with repeated string
+concatenation and then JSON encoded it again inside the tool nodes, with
+rendering structured SearchResults in a single pass.
+
+Run from the repository root:
+
+    python benchmarks/docgen/bench_render.py
+"""
+
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "code"))
+
+from docgen_agent.sources import SearchResults, Source  # noqa: E402
+
+
+def _concatenate(results: list[dict], max_tokens_per_source: int) -> str:
+    """The previous formatting code, followed by the tool node's json.dumps."""
+    formatted_text = "Sources:\n\n"
+    for source in results:
+        formatted_text += f"Source {source['title']}:\n===\n"
+        formatted_text += f"URL: {source['url']}\n===\n"
+        formatted_text += (
+            f"Most relevant content from source: {source['content']}\n===\n"
+        )
+        formatted_text += f"Full source content limited to {max_tokens_per_source} tokens: {source['raw_content']}\n\n"
+    return json.dumps(formatted_text.strip())
+
+
+def _measure(func: Callable[[], object], repeat: int) -> tuple[float, int]:
+    """Return the best wall time and the peak traced allocation of func."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sources", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    results = [
+        {
+            "title": f"Source title {idx}",
+            "url": f"https://example.com/articles/{idx}",
+            "content": "GPUs accelerate deep learning training workloads. " * 8,
+            "raw_content": "Tensor cores multiply matrices quickly. " * 40,
+            "score": 0.5,
+        }
+        for idx in range(args.sources)
+    ]
+    search_results = SearchResults(
+        sources=[Source.from_result(result, True) for result in results],
+        max_tokens_per_source=1000,
+    )
+
+    old_time, old_peak = _measure(lambda: _concatenate(results, 1000), args.repeat)
+    new_time, new_peak = _measure(search_results.render, args.repeat)
+
+    print(f"{'approach':<24} {'seconds':>9} {'peak MiB':>9}")
+    print(f"{'concatenate + json':<24} {old_time:>9.4f} {old_peak / 2**20:>9.1f}")
+    print(f"{'SearchResults.render':<24} {new_time:>9.4f} {new_peak / 2**20:>9.1f}")
+    print(f"speedup: {old_time / new_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,351 @@
+"""Benchmark how the report workflow scales with synthetic NIM and Tavily stand-ins.
+
+Runs agent.graph end to end against a fake chat model and a fake search
+backend with configurable latency, error and 429 rates. It sweeps the
+number of sections, the queries per search and the concurrency mode. For
+each run it reports wall time, peak RSS, the calls made and the tail
+latency of section completion. Every run is a fresh subprocess, so peak
+RSS and module state are not shared between runs.
+
+Concurrency modes:
+
+    production  the limiters as configured for a real deployment
+    unlimited   no LLM or search limits, to isolate orchestration overhead
+    serial      one LLM call and one search at a time
+
+Run from the repository root:
+
+    python benchmarks/docgen/bench_scaling.py
+    python benchmarks/docgen/bench_scaling.py --sections 5,25,100 --modes unlimited
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+import zlib
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "code"))
+
+_WORDS = [f"term{idx}" for idx in range(400)]
+
+
+class FakeHTTPError(Exception):
+    """An HTTP error shaped like the ones the real clients raise."""
+
+    def __init__(self, status_code: int) -> None:
+        super().__init__(f"[{status_code}] Injected error")
+        self.status_code = status_code
+        self.response = SimpleNamespace(status_code=status_code, headers={})
+
+
+class FakeEndpoint:
+    """Injects latency and failures into calls, and counts them."""
+
+    def __init__(
+        self, latency: float, error_rate: float, rate_limit_rate: float, seed: int
+    ) -> None:
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.calls = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self._random = random.Random(seed)
+
+    async def call(self) -> None:
+        self.calls += 1
+        # Lognormal latency with the given median, like real service times.
+        await asyncio.sleep(self.latency * self._random.lognormvariate(0, 0.5))
+        roll = self._random.random()
+        if roll < self.rate_limit_rate:
+            self.rate_limited += 1
+            raise FakeHTTPError(429)
+        if roll < self.rate_limit_rate + self.error_rate:
+            self.errors += 1
+            raise FakeHTTPError(500)
+
+    def as_dict(self) -> dict[str, int]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "rate_limited": self.rate_limited,
+        }
+
+
+def _make_fake_chat_model(
+    endpoint: FakeEndpoint, sections: int, queries: int, rounds: int
+) -> type:
+    """Build a chat model class that plans, searches and writes like ChatNVIDIA."""
+    from langchain_core.language_models import BaseChatModel
+    from langchain_core.messages import AIMessage, AIMessageChunk, ToolMessage
+    from langchain_core.output_parsers import JsonOutputParser
+    from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+    plan = json.dumps(
+        {
+            "title": "Synthetic report",
+            "sections": [
+                {
+                    "name": f"Section {idx}",
+                    "description": f"Synthetic section {idx}",
+                    "research": 0 < idx < sections - 1,
+                    "content": "",
+                }
+                for idx in range(sections)
+            ],
+        }
+    )
+
+    class FakeChatModel(BaseChatModel):
+        model: str = "fake"
+        temperature: float = 0
+
+        @property
+        def _llm_type(self) -> str:
+            return "fake-nim"
+
+        def bind_tools(self, tools: Any, **kwargs: Any) -> Any:
+            return self.bind(tools=[getattr(tool, "name", str(tool)) for tool in tools])
+
+        def with_structured_output(self, schema: Any, **kwargs: Any) -> Any:
+            return self.bind(structured=True) | JsonOutputParser()
+
+        def _generate(self, *args: Any, **kwargs: Any) -> ChatResult:
+            raise NotImplementedError("The fake chat model is async only.")
+
+        async def _agenerate(
+            self, messages: list, stop: Any = None, run_manager: Any = None, **kwargs
+        ) -> ChatResult:
+            message = await self._respond(messages, **kwargs)
+            return ChatResult(generations=[ChatGeneration(message=message)])
+
+        async def _astream(
+            self, messages: list, stop: Any = None, run_manager: Any = None, **kwargs
+        ):
+            message = await self._respond(messages, **kwargs)
+            text = str(message.content)
+            for start in range(0, len(text), 64):
+                chunk = AIMessageChunk(content=text[start : start + 64])
+                yield ChatGenerationChunk(message=chunk)
+
+        async def _respond(self, messages: list, **kwargs: Any) -> AIMessage:
+            await endpoint.call()
+            if kwargs.get("structured"):
+                return AIMessage(content=plan)
+            if kwargs.get("tools"):
+                done = sum(isinstance(message, ToolMessage) for message in messages)
+                if done >= rounds:
+                    return AIMessage(content="Research complete.")
+                prompt = str(messages[0].content).encode()
+                rng = random.Random(zlib.crc32(prompt) + done)
+                search = [" ".join(rng.sample(_WORDS, 4)) for _ in range(queries)]
+                tool_call = {
+                    "name": "search_tavily",
+                    "args": {"queries": search, "topic": "general"},
+                    "id": f"call_{rng.getrandbits(64):x}",
+                    "type": "tool_call",
+                }
+                return AIMessage(content="", tool_calls=[tool_call])
+            return AIMessage(content="Synthetic section text. " * 100)
+
+    return FakeChatModel
+
+
+class FakeSearchBackend:
+    """Returns Tavily shaped results drawn from a fixed universe of pages."""
+
+    def __init__(self, endpoint: FakeEndpoint, universe: int) -> None:
+        self.endpoint = endpoint
+        self.universe = universe
+
+    async def search(self, query: str, *, max_results: int, **kwargs: Any) -> dict:
+        await self.endpoint.call()
+        rng = random.Random(zlib.crc32(query.encode()))
+        results = []
+        for page in rng.sample(range(self.universe), max_results):
+            page_rng = random.Random(page)
+            results.append(
+                {
+                    "title": f"Page {page}",
+                    "url": f"https://example.com/pages/{page}",
+                    "content": " ".join(page_rng.choices(_WORDS, k=120)),
+                    "score": rng.random(),
+                    "raw_content": None,
+                }
+            )
+        return {"query": query, "results": results}
+
+
+def _percentile(samples: list[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, math.ceil(pct * len(ordered)) - 1)]
+
+
+def run_once(config: dict[str, Any]) -> dict[str, Any]:
+    """Write one synthetic report in this process and measure it."""
+    # Keep the run off the disk caches and away from real credentials.
+    os.environ.update(
+        {
+            "LLM_CACHE_PATH": "",
+            "TAVILY_CACHE_PATH": "",
+            "DOCGEN_CHECKPOINT_PATH": "",
+            "TAVILY_API_KEY": os.getenv("TAVILY_API_KEY", "benchmark"),
+            "DOCGEN_MAX_SEARCH_ROUNDS": str(config["rounds"]),
+        }
+    )
+    llm_endpoint = FakeEndpoint(
+        config["llm_latency"], config["error_rate"], config["rate_limit_rate"], 1
+    )
+    search_endpoint = FakeEndpoint(
+        config["search_latency"], config["error_rate"], config["rate_limit_rate"], 2
+    )
+
+    # Clients import ChatNVIDIA when their first call builds them, so the
+    # fake only has to be in place before the workflow runs.
+    import langchain_nvidia_ai_endpoints
+
+    langchain_nvidia_ai_endpoints.ChatNVIDIA = _make_fake_chat_model(
+        llm_endpoint, config["sections"], config["queries"], config["rounds"]
+    )
+
+    from docgen_agent import agent, author, ratelimit, researcher, retry, tools
+
+    # Backoff delays are scaled with the fake latencies.
+    policy = retry.RetryPolicy(attempts=5, base_delay=config["llm_latency"])
+    for module in (agent, author, researcher):
+        module.llm_retry = policy
+    agent._QUERIES_PER_SECTION = config["queries"]
+    tools.search_backend = FakeSearchBackend(search_endpoint, config["universe"])
+    tools.search_cache = None
+
+    mode = config["mode"]
+    if mode == "unlimited":
+        retry.llm_limiter = ratelimit.AIMDLimiter(
+            initial=1_000_000, max_limit=1_000_000
+        )
+        tools.search_limiter = ratelimit.AdaptiveRateLimiter(
+            max_rate=1_000_000, max_concurrency=1_000_000
+        )
+    elif mode == "serial":
+        retry.llm_limiter = ratelimit.AIMDLimiter(initial=1, max_limit=1)
+        tools.search_limiter = ratelimit.AdaptiveRateLimiter(
+            max_rate=1_000_000, max_concurrency=1
+        )
+
+    async def write() -> list[float]:
+        state = agent.AgentState(topic="Synthetic topic", report_structure="Any")
+        start = time.perf_counter()
+        finished = []
+        async for event in agent.graph.astream(state, stream_mode="custom"):
+            if event["type"] == "section":
+                finished.append(time.perf_counter() - start)
+        return finished
+
+    start = time.perf_counter()
+    error = None
+    try:
+        finished = asyncio.run(write())
+    except Exception as err:
+        finished, error = [], f"{type(err).__name__}: {err}"
+    wall = time.perf_counter() - start
+
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS.
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak_rss //= 1024
+    return {
+        **config,
+        "wall_s": wall,
+        "peak_rss_mb": peak_rss / 1024,
+        "llm": llm_endpoint.as_dict(),
+        "search": search_endpoint.as_dict(),
+        "sections_done": len(finished),
+        "section_p50_s": _percentile(finished, 0.5),
+        "section_p95_s": _percentile(finished, 0.95),
+        "section_p99_s": _percentile(finished, 0.99),
+        "error": error,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sections", default="5,10,25,50,100")
+    parser.add_argument("--queries", default="3,5")
+    parser.add_argument("--modes", default="production,unlimited,serial")
+    parser.add_argument("--rounds", type=int, default=2)
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--search-latency", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.01)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.02)
+    parser.add_argument("--universe", type=int, default=5_000)
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--run", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        print(json.dumps(run_once(json.loads(args.run))))
+        return
+
+    header = (
+        f"{'mode':<11} {'sections':>8} {'queries':>7} {'wall s':>8} {'rss MB':>7} "
+        f"{'llm':>6} {'search':>6} {'429s':>5} {'errors':>6} {'p50 s':>7} "
+        f"{'p95 s':>7} {'p99 s':>7}"
+    )
+    print(header)
+    print("-" * len(header))
+    results = []
+    for mode, sections, queries in itertools.product(
+        args.modes.split(","),
+        [int(value) for value in args.sections.split(",")],
+        [int(value) for value in args.queries.split(",")],
+    ):
+        config = {
+            "mode": mode,
+            "sections": sections,
+            "queries": queries,
+            "rounds": args.rounds,
+            "llm_latency": args.llm_latency,
+            "search_latency": args.search_latency,
+            "error_rate": args.error_rate,
+            "rate_limit_rate": args.rate_limit_rate,
+            "universe": args.universe,
+        }
+        output = subprocess.run(
+            [sys.executable, __file__, "--run", json.dumps(config)],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        results.append(result)
+        llm, search = result["llm"], result["search"]
+        print(
+            f"{mode:<11} {sections:>8} {queries:>7} {result['wall_s']:>8.2f} "
+            f"{result['peak_rss_mb']:>7.1f} {llm['calls']:>6} {search['calls']:>6} "
+            f"{llm['rate_limited'] + search['rate_limited']:>5} "
+            f"{llm['errors'] + search['errors']:>6} {result['section_p50_s']:>7.2f} "
+            f"{result['section_p95_s']:>7.2f} {result['section_p99_s']:>7.2f}"
+        )
+        if result["error"]:
+            print(f"  failed: {result['error']}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as output_file:
+            json.dump(results, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""Benchmark per-call latency with and without the shared HTTP pool.
+
+Calls ChatNVIDIA.ainvoke against a local OpenAI-style server from a
+number of concurrent workers, the way concurrent sections call NIM. Two
+transports are compared:
+
+    fresh   ChatNVIDIA as it comes, with a new aiohttp session per call
+    pooled  the same client after HTTPPool.attach(), on the shared pool
+
+The server sleeps for --connect-latency on every new connection, to
+stand in for the TCP and TLS handshakes to a remote endpoint, and for
+--server-latency on every request. It reports the per-call latency,
+the connections the server accepted and the pool's own metrics.
+
+Run from the repository root:
+
+    python benchmarks/docgen/bench_transport.py
+    python benchmarks/docgen/bench_transport.py --calls 400 --concurrency 20,50
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import socket
+import sys
+import threading
+import time
+import warnings
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "code"))
+
+_COMPLETION = json.dumps(
+    {
+        "id": "chatcmpl-bench",
+        "object": "chat.completion",
+        "model": "bench",
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": "ok"},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 1, "total_tokens": 11},
+    }
+).encode()
+
+
+class FakeNIMServer(ThreadingHTTPServer):
+    """A keep-alive chat completions endpoint that counts its connections."""
+
+    daemon_threads = True
+    # Room for every worker to connect at once, without dropped SYNs and
+    # their one second retransmits.
+    request_queue_size = 256
+
+    def __init__(self, connect_latency: float, server_latency: float) -> None:
+        self.connect_latency = connect_latency
+        self.server_latency = server_latency
+        self.connections = 0
+        self._lock = threading.Lock()
+        super().__init__(("127.0.0.1", 0), _Handler)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: FakeNIMServer
+
+    def setup(self) -> None:
+        super().setup()
+        # Headers and body are written separately, so without this Nagle's
+        # algorithm holds the body back for the client's delayed ACK.
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self.server._lock:
+            self.server.connections += 1
+        time.sleep(self.server.connect_latency)
+
+    def do_POST(self) -> None:
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.server.server_latency)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(_COMPLETION)))
+        self.end_headers()
+        self.wfile.write(_COMPLETION)
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+async def run(model: Any, calls: int, concurrency: int) -> list[float]:
+    """Make calls ainvoke calls from concurrency workers and time each of them."""
+    queue: asyncio.Queue[int] = asyncio.Queue()
+    for idx in range(calls):
+        queue.put_nowait(idx)
+    latencies: list[float] = []
+
+    async def worker() -> None:
+        while not queue.empty():
+            queue.get_nowait()
+            start = time.perf_counter()
+            await model.ainvoke("hi")
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies
+
+
+def measure(
+    server: FakeNIMServer, pool: Any, calls: int, concurrency: int
+) -> dict[str, Any]:
+    """Time a run of calls, through pool if it is given, on a fresh client."""
+    from langchain_nvidia_ai_endpoints import ChatNVIDIA
+
+    with warnings.catch_warnings():
+        # The local server hosts a model ChatNVIDIA does not know.
+        warnings.simplefilter("ignore")
+        model = ChatNVIDIA(base_url=server.base_url, model="bench", api_key="bench")
+    if pool is not None:
+        pool.attach(model)
+
+    async def timed() -> tuple[list[float], float]:
+        start = time.perf_counter()
+        try:
+            latencies = await run(model, calls, concurrency)
+        finally:
+            if pool is not None:
+                await pool.aclose()
+        return latencies, time.perf_counter() - start
+
+    connections = server.connections
+    latencies, wall = asyncio.run(timed())
+    return {
+        "wall_s": wall,
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p95_ms": _percentile(latencies, 95) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000,
+        "connections": server.connections - connections,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--concurrency", default="1,8,20")
+    parser.add_argument("--connect-latency", type=float, default=0.03)
+    parser.add_argument("--server-latency", type=float, default=0.01)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    from docgen_agent.transport import HTTPPool
+
+    server = FakeNIMServer(args.connect_latency, args.server_latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    header = (
+        f"{'transport':<9} {'workers':>7} {'wall s':>7} {'p50 ms':>7} "
+        f"{'p95 ms':>7} {'p99 ms':>7} {'conns':>6} {'reuse':>6}"
+    )
+    print(header)
+    print("-" * len(header))
+    results = []
+    for concurrency in [int(value) for value in args.concurrency.split(",")]:
+        pool = HTTPPool(size=concurrency, hosts=1)
+        for transport, shared in [("fresh", None), ("pooled", pool)]:
+            result = measure(server, shared, args.calls, concurrency)
+            reuse = 1 - result["connections"] / args.calls
+            result.update(transport=transport, concurrency=concurrency, reuse=reuse)
+            if transport == "pooled":
+                result["pool"] = pool.stats.as_dict()
+            results.append(result)
+            print(
+                f"{transport:<9} {concurrency:>7} {result['wall_s']:>7.2f} "
+                f"{result['p50_ms']:>7.1f} {result['p95_ms']:>7.1f} "
+                f"{result['p99_ms']:>7.1f} {result['connections']:>6} {reuse:>6.1%}"
+            )
+    server.shutdown()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as output_file:
+            json.dump(results, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,217 @@
 """Main entry point for the report generation workflow."""
 
 import asyncio
-from typing import Any
+import logging
+import uuid
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Iterable
 
-from .agent import AgentState, graph
+from langgraph.checkpoint.base import BaseCheckpointSaver
+
+from . import checkpoint, tools
+from .agent import AgentState, graph, subgraph_names, workflow
+from .cache import llm_cache
+from .governor import governor
+from .ratelimit import current_job
+from .transport import http_pool
+
+_LOGGER = logging.getLogger(__name__)
+
+
+@dataclass
+class ReportJob:
+    """A report to write as part of a batch."""
+
+    topic: str
+    report_structure: str
+    run_id: str | None = None
+
+
+@dataclass
+class ReportResult:
+    """The outcome of one job in a batch, with either its report or its error."""
+
+    job: ReportJob
+    run_id: str
+    report: str | None = None
+    error: Exception | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+async def _run_report(
+    saver: BaseCheckpointSaver | None, state: AgentState
+) -> dict[str, Any]:
+    """Run the workflow for one report, checkpointing it with saver."""
+    _LOGGER.info("Writing report with run ID %s", state.report_id)
+    try:
+        result = await workflow.compile(checkpointer=saver).ainvoke(
+            state, checkpoint.run_config(state.report_id)
+        )
+        await _delete_checkpoints(saver, state.report_id, result)
+        return result
+    except Exception:
+        if saver is not None:
+            _LOGGER.error("Report failed, resume it with run ID %s", state.report_id)
+        raise
+
+
+async def _delete_checkpoints(
+    saver: BaseCheckpointSaver | None, run_id: str, result: dict[str, Any]
+) -> None:
+    """Delete the checkpoints of a finished run, which is never resumed."""
+    if saver is None:
+        return
+    await checkpoint.delete_run(
+        saver, run_id, subgraph_names(result.get("report_plan"))
+    )
+
+
+def _log_stats(search_stats: tools.SearchStats) -> None:
+    _LOGGER.info("Search stats: %s", tools.search_stats - search_stats)
+    if llm_cache is not None:
+        _LOGGER.info("LLM cache stats: %s", llm_cache.stats.as_dict())
+    _LOGGER.info("Research loop stats: %s", governor.stats.as_dict())
+    _LOGGER.info("HTTP pool stats: %s", http_pool.stats.as_dict())
 
 
 async def async_write_report(
-    topic: str, report_structure: str
+    topic: str, report_structure: str, run_id: str | None = None
 ) -> Any | dict[str, Any] | None:
-    """Write a report."""
-    state = AgentState(topic=topic, report_structure=report_structure)
-    result = await graph.ainvoke(state)
+    """Write a report.
+
+    Progress is checkpointed under run_id, a new random ID by default, so a
+    failed run can be picked up again with resume_report.
+    """
+    run_id = run_id or uuid.uuid4().hex
+    state = AgentState(topic=topic, report_structure=report_structure, report_id=run_id)
+    search_stats = tools.search_stats.copy()
+    async with http_pool.use(), checkpoint.checkpointer() as saver:
+        result = await _run_report(saver, state)
+    _log_stats(search_stats)
     return result
 
 
-def write_report(topic: str, report_structure: str) -> Any | dict[str, Any] | None:
+def write_report(
+    topic: str, report_structure: str, run_id: str | None = None
+) -> Any | dict[str, Any] | None:
     """Write a report."""
-    return asyncio.run(async_write_report(topic, report_structure))
+    return asyncio.run(async_write_report(topic, report_structure, run_id))
+
+
+async def async_write_reports(
+    jobs: Iterable[ReportJob], max_concurrency: int = 8
+) -> list[ReportResult]:
+    """Write many reports concurrently on one event loop.
+
+    Up to max_concurrency reports run at a time. They share the process
+    wide LLM and search limiters, and the LLM limiter grants waiting calls
+    to each report in turn. A failed report does not stop the others, so
+    every job gets a result, in the order of jobs.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run(saver: BaseCheckpointSaver | None, job: ReportJob) -> ReportResult:
+        run_id = job.run_id or uuid.uuid4().hex
+        state = AgentState(
+            topic=job.topic, report_structure=job.report_structure, report_id=run_id
+        )
+        async with semaphore:
+            # Each job runs in its own task, so this only tags its own calls.
+            current_job.set(run_id)
+            try:
+                result = await _run_report(saver, state)
+            except Exception as err:
+                _LOGGER.error("Report on %s failed: %s", job.topic, err)
+                return ReportResult(job=job, run_id=run_id, error=err)
+        return ReportResult(job=job, run_id=run_id, report=result.get("report"))
+
+    search_stats = tools.search_stats.copy()
+    async with http_pool.use(), checkpoint.checkpointer() as saver:
+        results = await asyncio.gather(*(run(saver, job) for job in jobs))
+    failed = sum(not result.ok for result in results)
+    _LOGGER.info("Wrote %d reports, %d failed.", len(results) - failed, failed)
+    _log_stats(search_stats)
+    return results
+
+
+def write_reports(
+    jobs: Iterable[ReportJob], max_concurrency: int = 8
+) -> list[ReportResult]:
+    """Write many reports concurrently."""
+    return asyncio.run(async_write_reports(jobs, max_concurrency))
+
+
+async def async_resume_report(run_id: str) -> Any | dict[str, Any] | None:
+    """Resume a checkpointed report run.
+
+    Research and sections that already finished are reused as they are, and
+    only the nodes that failed or never ran are executed.
+    """
+    async with http_pool.use(), checkpoint.checkpointer() as saver:
+        if saver is None:
+            raise ValueError("Checkpointing is disabled, so runs cannot be resumed.")
+        resumable = workflow.compile(checkpointer=saver)
+        config = checkpoint.run_config(run_id)
+        snapshot = await resumable.aget_state(config)
+        if not snapshot.values:
+            raise ValueError(f"No checkpoint found for run ID {run_id}.")
+        _LOGGER.info("Resuming report run %s at %s", run_id, snapshot.next)
+        result = await resumable.ainvoke(None, config)
+        await _delete_checkpoints(saver, run_id, result)
+        return result
+
+
+def resume_report(run_id: str) -> Any | dict[str, Any] | None:
+    """Resume a checkpointed report run."""
+    return asyncio.run(async_resume_report(run_id))
+
+
+async def astream_report(
+    topic: str, report_structure: str
+) -> AsyncIterator[dict[str, Any]]:
+    """Write a report, yielding each part as soon as it can be shown.
+
+    Yields events in this order:
+        {"type": "title", "title": ..., "sections": [names]} once planned.
+        {"type": "section", "index": ..., "name": ..., "content": ...} for
+            each section in plan order, once it and every earlier section
+            are finished.
+        {"type": "progress", "index": ..., "name": ..., "completed": ...,
+            "total": ...} when a section finishes before an earlier one.
+        {"type": "report", "report": ...} with the complete report.
+    """
+    state = AgentState(topic=topic, report_structure=report_structure)
+    search_stats = tools.search_stats.copy()
+
+    finished: dict[int, dict[str, Any]] = {}
+    next_index = 0
+    total = 0
+    async with http_pool.use():
+        async for event in graph.astream(state, stream_mode="custom"):
+            if event["type"] == "plan":
+                total = len(event["sections"])
+                yield {
+                    "type": "title",
+                    "title": event["title"],
+                    "sections": event["sections"],
+                }
+            elif event["type"] == "section":
+                finished[event["index"]] = event
+                if event["index"] != next_index:
+                    yield {
+                        "type": "progress",
+                        "index": event["index"],
+                        "name": event["name"],
+                        "completed": len(finished),
+                        "total": total,
+                    }
+                while next_index in finished:
+                    yield finished[next_index]
+                    next_index += 1
+            elif event["type"] == "report":
+                yield event
+
+    _log_stats(search_stats)
@@ -5,7 +5,7 @@ This code is a simple example of how to use the report generation workflow.
 
 import logging
 
-from . import write_report
+from . import telemetry, tools, transport, write_report
 
 logging.basicConfig(level=logging.INFO)
 result = write_report(
@@ -34,3 +34,8 @@ The report structure should include:
 )
 if result:
     print("\n\n" + result["report"] + "\n\n")
+
+print(telemetry.tracer.summary())
+print(f"\nSearch: {tools.search_stats}")
+print(f"HTTP pool: {transport.http_pool.stats.as_dict()}")
+telemetry.tracer.export_chrome_trace()
@@ -3,25 +3,40 @@ The main agent that orchestrates the report generation process.
 """
 
 import asyncio
+import contextvars
+import functools
+import json
 import logging
-import os
-from typing import Annotated, Any, Sequence, cast
+import uuid
+from typing import Annotated, Any, AsyncIterator, Awaitable, Callable, Sequence, cast
 
+from langchain_core.load import dumps
+from langchain_core.outputs import Generation
 from langchain_core.runnables import RunnableConfig
-from langchain_nvidia_ai_endpoints import ChatNVIDIA
 from langgraph.graph import END, START, StateGraph
 from langgraph.graph.message import add_messages
-from pydantic import BaseModel
-
-from . import author, researcher
+from langgraph.types import StreamWriter
+from pydantic import BaseModel, Field
+
+from . import (
+    author,
+    cassette,
+    checkpoint,
+    models,
+    pool,
+    researcher,
+    sources,
+    tokenizer,
+)
+from .cache import llm_cache
 from .prompts import report_planner_instructions
+from .retry import llm_retry
+from .telemetry import traced
 
 _LOGGER = logging.getLogger(__name__)
-_MAX_LLM_RETRIES = 3
 _QUERIES_PER_SECTION = 5
-_THROTTLE_LLM_CALLS = os.getenv("THROTTLE_LLM_CALLS", "0")
-
-llm = ChatNVIDIA(model="meta/llama-3.3-70b-instruct", temperature=0)
+_RESEARCH_BRIEF_TOKENS = 4000
+_RESEARCH_BRIEF_TOKENS_PER_SOURCE = 400
 
 
 class Report(BaseModel):
@@ -29,14 +44,60 @@ class Report(BaseModel):
     sections: list[author.Section]
 
 
+# A JSON schema, unlike a pydantic model, streams partial objects.
+planner = models.route(
+    "planner",
+    lambda llm: llm.with_structured_output(Report.model_json_schema()),  # type: ignore
+)
+
+
+def subgraph_name(step: str, index: int | None = None) -> str:
+    """Name the checkpoint thread of a subgraph run within a report."""
+    return step if index is None else f"{step}-{index}"
+
+
+def subgraph_names(report_plan: Report | None) -> list[str]:
+    """Name every subgraph thread checkpointed for a report."""
+    sections = len(report_plan.sections) if report_plan else 0
+    return [
+        subgraph_name("research"),
+        subgraph_name("plan"),
+        *(subgraph_name("section", idx) for idx in range(sections)),
+    ]
+
+
 class AgentState(BaseModel):
     topic: str
     report_structure: str
+    report_id: str = Field(default_factory=lambda: uuid.uuid4().hex)
+    research_brief: str | None = None
     report_plan: Report | None = None
     report: str | None = None
     messages: Annotated[Sequence[Any], add_messages] = []
 
 
+def _releases_pool_on_error(
+    node: Callable[..., Awaitable[Any]],
+) -> Callable[..., Awaitable[Any]]:
+    """Release the report's research pool when a workflow node fails.
+
+    The pool lives outside the graph state, so a run that stops early would
+    otherwise keep it in memory. A finished run releases it in report_author.
+    """
+
+    @functools.wraps(node)
+    async def wrapper(state: AgentState, *args: Any, **kwargs: Any) -> Any:
+        try:
+            return await node(state, *args, **kwargs)
+        except BaseException:
+            pool.release_pool(state.report_id)
+            raise
+
+    return wrapper
+
+
+@traced
+@_releases_pool_on_error
 async def topic_research(state: AgentState, config: RunnableConfig):
     """Research the topic of the document."""
     _LOGGER.info("Performing initial topic research.")
@@ -44,84 +105,270 @@ async def topic_research(state: AgentState, config: RunnableConfig):
     researcher_state = researcher.ResearcherState(
         topic=state.topic,
         number_of_queries=_QUERIES_PER_SECTION,
+        report_id=state.report_id,
         messages=state.messages,
     )
 
-    research = await researcher.graph.ainvoke(researcher_state, config)
+    research = await researcher.graph.ainvoke(
+        researcher_state, checkpoint.subgraph_config(config, subgraph_name("research"))
+    )
 
     return {"messages": research.get("messages", [])}
 
 
-async def report_planner(state: AgentState, config: RunnableConfig):
-    """Call the model."""
-    _LOGGER.info("Calling report planner.")
+@traced
+@_releases_pool_on_error
+async def research_compactor(state: AgentState):
+    """Distill the research transcript into a compact brief for the authors."""
+    _LOGGER.info("Compacting topic research.")
+
+    found: list[sources.Source] = []
+    for message in state.messages:
+        artifact = getattr(message, "artifact", None)
+        if isinstance(artifact, sources.SearchResults):
+            found.extend(artifact.sources)
+    if not found:
+        return {}
+
+    model = models.primary_model("writer")
+    await tokenizer.load(model)
+    brief = sources.compact(
+        found,
+        focus=state.topic,
+        max_tokens=_RESEARCH_BRIEF_TOKENS,
+        max_tokens_per_source=_RESEARCH_BRIEF_TOKENS_PER_SOURCE,
+        model=model,
+    ).render()
+    _LOGGER.info("Compacted %d sources into a research brief.", len(found))
+    return {"research_brief": brief}
+
+
+class PlannerState(BaseModel):
+    topic: str
+    report_structure: str
+    messages: Annotated[Sequence[Any], add_messages] = []
+    report_plan: Report | None = None
 
-    model = llm.with_structured_output(Report)  # type: ignore
+
+# Where plan_report hands out each section as soon as it is planned. The
+# orchestrator sets it, and the planner subgraph runs in a copy of its context.
+_planned_sections: contextvars.ContextVar[asyncio.Queue[author.Section] | None] = (
+    contextvars.ContextVar("planned_sections", default=None)
+)
+
+
+@traced
+async def plan_report(state: PlannerState, config: RunnableConfig) -> dict[str, Any]:
+    """Plan the report, handing out each section as soon as it is planned.
+
+    The plan is streamed as partial JSON. Once a later section has started,
+    every earlier one is complete.
+    """
+    _LOGGER.info("Calling report planner.")
 
     system_prompt = report_planner_instructions.format(
         topic=state.topic,
         report_structure=state.report_structure,
     )
-    for count in range(_MAX_LLM_RETRIES):
-        messages = [{"role": "system", "content": system_prompt}] + list(state.messages)
-        response = await model.ainvoke(messages, config)
-        if response:
-            response = cast(Report, response)
-            state.report_plan = response
-            return state
-        _LOGGER.debug(
-            "Retrying LLM call. Attempt %d of %d", count + 1, _MAX_LLM_RETRIES
-        )
-
-    raise RuntimeError("Failed to call model after %d attempts.", _MAX_LLM_RETRIES)
-
+    messages = [{"role": "system", "content": system_prompt}] + list(state.messages)
+    plan = _cached_plan(messages)
+    if plan is None:
+        planned_sections = _planned_sections.get()
+        planned = 0
+        async for plan in llm_retry.astream(planner, messages, config):
+            sections = plan.get("sections") or []
+            for section in sections[planned:-1]:
+                if planned_sections is not None:
+                    planned_sections.put_nowait(author.Section.model_validate(section))
+            planned = max(planned, len(sections) - 1)
+        if plan is None:
+            raise ValueError("The report planner returned no plan.")
+        _cache_plan(messages, plan)
+    return {"report_plan": Report.model_validate(plan)}
+
+
+# Streamed responses skip the LLM cache, so finished plans are cached here.
+def _plan_llm_string() -> str:
+    return "docgen_report_plan:" + ",".join(models.ROUTES["planner"])
+
+
+def _cached_plan(messages: list[Any]) -> dict[str, Any] | None:
+    if llm_cache is None or cassette.active is not None:
+        return None
+    cached = llm_cache.lookup(dumps(messages), _plan_llm_string())
+    return json.loads(cached[0].text) if cached else None
+
+
+def _cache_plan(messages: list[Any], plan: dict[str, Any]) -> None:
+    if llm_cache is None or cassette.active is not None:
+        return
+    generation = Generation(text=json.dumps(plan))
+    llm_cache.update(dumps(messages), _plan_llm_string(), [generation])
+
+
+planner_workflow = StateGraph(PlannerState)
+planner_workflow.add_node("planner", plan_report)
+planner_workflow.add_edge(START, "planner")
+planner_workflow.add_edge("planner", END)
+planner_graph = planner_workflow.compile()
+
+
+@traced
+@_releases_pool_on_error
+async def section_author_orchestrator(
+    state: AgentState, config: RunnableConfig, writer: StreamWriter
+):
+    """Orchestrate the section authoring process.
+
+    Each section author starts as soon as the planner has finished planning
+    its section, so planning overlaps with research and writing.
+    """
+    _LOGGER.info("Orchestrating the section authoring process.")
 
-async def section_author_orchestrator(state: AgentState, config: RunnableConfig):
-    """Orchestrate the section authoring process."""
-    if not state.report_plan:
-        raise ValueError("Report plan is not set.")
+    # Authors get the compact research brief rather than the whole transcript.
+    if state.research_brief:
+        brief = f"Research on the report topic:\n\n{state.research_brief}"
+        research = [{"role": "user", "content": brief}]
+        model = models.primary_model("writer")
+        await tokenizer.load(model)
+        transcript_tokens = sum(
+            tokenizer.count_tokens_batch(
+                [str(message.content) for message in state.messages], model
+            )
+        )
+        saved_tokens = transcript_tokens - tokenizer.count_tokens(brief, model)
+        _LOGGER.info("Research brief saves %d prompt tokens per section.", saved_tokens)
+    else:
+        research = list(state.messages)
 
-    _LOGGER.info("Orchestrating the section authoring process.")
+    # Write all sections at once. The shared LLM limiter adapts how many
+    # model calls are actually in flight to what the endpoint can sustain.
+    section_writers: list[asyncio.Task] = []
 
-    writers = []
-    for idx, section in enumerate(state.report_plan.sections):
+    def start_section(section: author.Section) -> None:
+        idx = len(section_writers)
         _LOGGER.info("Creating author agent for section: %s", section.name)
-
         section_writer_state = author.SectionWriterState(
             index=idx,
             section=section,
             topic=state.topic,
-            messages=state.messages,
+            report_id=state.report_id,
+            messages=research,
         )
-        writers.append(author.graph.ainvoke(section_writer_state, config))
-
-    all_sections = []
-    if _THROTTLE_LLM_CALLS == "1":
-        # Throttle LLM calls by writing one section at a time
-        _LOGGER.info("Throttling LLM calls.")
-        for writer in writers:
-            all_sections.append(await writer)
-            await asyncio.sleep(30)
-    else:
-        # Without throttling, write all sections at once
-        all_sections = await asyncio.gather(*writers)
-    all_sections = cast(list[dict[str, Any]], all_sections)
+        section_writers.append(
+            asyncio.create_task(
+                _author_section(
+                    section_writer_state,
+                    checkpoint.subgraph_config(config, subgraph_name("section", idx)),
+                )
+            )
+        )
+
+    # The plan is checkpointed in its own subgraph, so a resumed run reuses
+    # it rather than planning again. Sections are started as they stream in.
+    # A resumed plan is not streamed, and every section starts once it returns.
+    planned_sections: asyncio.Queue[author.Section] = asyncio.Queue()
+    token = _planned_sections.set(planned_sections)
+    planning = asyncio.create_task(
+        planner_graph.ainvoke(
+            PlannerState(
+                topic=state.topic,
+                report_structure=state.report_structure,
+                messages=state.messages,
+            ),
+            checkpoint.subgraph_config(config, subgraph_name("plan")),
+        )
+    )
+    _planned_sections.reset(token)
+    try:
+        while True:
+            next_section = asyncio.create_task(planned_sections.get())
+            await asyncio.wait(
+                {next_section, planning}, return_when=asyncio.FIRST_COMPLETED
+            )
+            if not next_section.done():
+                next_section.cancel()
+                break
+            start_section(next_section.result())
+        state.report_plan = Report.model_validate((await planning)["report_plan"])
+        # Sections still queued when planning finished are started here too.
+        for section in state.report_plan.sections[len(section_writers) :]:
+            start_section(section)
+    except BaseException:
+        planning.cancel()
+        for section_writer in section_writers:
+            section_writer.cancel()
+        raise
+
+    if not state.report_plan:
+        raise ValueError("Report plan is not set.")
+    writer(
+        {
+            "type": "plan",
+            "title": state.report_plan.title,
+            "sections": [section.name for section in state.report_plan.sections],
+        }
+    )
 
-    for section in all_sections:
+    # Each section is streamed out as soon as it is finished.
+    failures: dict[int, Exception] = {}
+    for finished_writer in asyncio.as_completed(section_writers):
+        section = await finished_writer
         index = section["index"]
+        if "error" in section:
+            failures[index] = section["error"]
+            continue
         content = section["section"].content
         state.report_plan.sections[index].content = content
         _LOGGER.info("Finished section: %s", state.report_plan.sections[index].name)
+        writer(
+            {
+                "type": "section",
+                "index": index,
+                "name": state.report_plan.sections[index].name,
+                "content": content,
+            }
+        )
+
+    # A failed section does not cancel the others, so every section that
+    # could be written is checkpointed before the run fails.
+    if failures:
+        names = ", ".join(state.report_plan.sections[idx].name for idx in failures)
+        raise RuntimeError(
+            f"Failed to write {len(failures)} of "
+            f"{len(state.report_plan.sections)} sections: {names}"
+        ) from next(iter(failures.values()))
 
     return state
 
 
-async def report_author(state: AgentState, config: RunnableConfig):
+async def _author_section(
+    section_writer_state: author.SectionWriterState, config: RunnableConfig
+) -> dict[str, Any]:
+    """Write one section, returning its error instead of raising it."""
+    try:
+        return cast(
+            dict[str, Any], await author.graph.ainvoke(section_writer_state, config)
+        )
+    except Exception as err:
+        _LOGGER.error(
+            "Failed to write section %s: %s", section_writer_state.section.name, err
+        )
+        return {"index": section_writer_state.index, "error": err}
+
+
+@traced
+@_releases_pool_on_error
+async def report_author(
+    state: AgentState, config: RunnableConfig, writer: StreamWriter
+):
     """Write the report."""
     if not state.report_plan:
         raise ValueError("Report plan is not set.")
 
     _LOGGER.info("Authoring the report.")
+    # Every search is done by now, so the research pool is no longer needed.
+    pool.release_pool(state.report_id)
 
     output = f"# {state.report_plan.title}\n\n"
     for section in state.report_plan.sections:
@@ -129,19 +376,20 @@ async def report_author(state: AgentState, config: RunnableConfig):
         output += "\n\n"
 
     state.report = output
+    writer({"type": "report", "report": output})
     return state
 
 
 workflow = StateGraph(AgentState)
 
 workflow.add_node("topic_research", topic_research)
-workflow.add_node("report_planner", report_planner)
+workflow.add_node("research_compactor", research_compactor)
 workflow.add_node("section_author_orchestrator", section_author_orchestrator)
 workflow.add_node("report_author", report_author)
 
 workflow.add_edge(START, "topic_research")
-workflow.add_edge("topic_research", "report_planner")
-workflow.add_edge("report_planner", "section_author_orchestrator")
+workflow.add_edge("topic_research", "research_compactor")
+workflow.add_edge("research_compactor", "section_author_orchestrator")
 workflow.add_edge("section_author_orchestrator", "report_author")
 workflow.add_edge("report_author", END)
 
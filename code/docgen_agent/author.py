@@ -1,23 +1,25 @@
 """Authoring workflow for writing sections of a report."""
 
-import json
 import logging
 from typing import Annotated, Any, Sequence
 
 from langchain_core.runnables import RunnableConfig
-from langchain_nvidia_ai_endpoints import ChatNVIDIA
 from langgraph.graph import END, START, StateGraph
 from langgraph.graph.message import add_messages
 from pydantic import BaseModel
 
-from . import tools
+from . import models, tools
+from .governor import governor
 from .prompts import section_research_prompt, section_writing_prompt
+from .retry import llm_retry
+from .telemetry import traced
 
 _LOGGER = logging.getLogger(__name__)
-_MAX_LLM_RETRIES = 3
 
-llm = ChatNVIDIA(model="meta/llama-3.3-70b-instruct", temperature=0)
-llm_with_tools = llm.bind_tools([tools.search_tavily])
+llm = models.route("writer")
+llm_with_tools = models.route(
+    "query_generator", lambda llm: llm.bind_tools([tools.search_tavily])
+)
 
 
 class Section(BaseModel):
@@ -31,28 +33,52 @@ class SectionWriterState(BaseModel):
     index: int = -1
     section: Section
     topic: str  # Overall report topic for context
+    report_id: str | None = None  # Report whose research pool to share
     messages: Annotated[Sequence[Any], add_messages] = []
+    search_rounds: int = 0  # Rounds of tool calls run so far
+    seen_urls: list[str] = []  # Sources found so far
+    novelty: float = 1.0  # Share of new content in the last round of results
 
 
+@traced
 async def tool_node(state: SectionWriterState):
     """Execute tool calls for research."""
     _LOGGER.info("Executing tool calls for section: %s", state.section.name)
+    focus = f"{state.section.name}: {state.section.description}"
     outputs = []
     for tool_call in state.messages[-1].tool_calls:
         _LOGGER.info("Executing tool call: %s", tool_call["name"])
         tool = getattr(tools, tool_call["name"])
-        tool_result = await tool.ainvoke(tool_call["args"])
-        outputs.append(
+        # Invoking the tool with the whole tool call returns a ToolMessage
+        # carrying the rendered results and the structured sources.
+        tool_message = await tool.ainvoke(
             {
-                "role": "tool",
-                "content": json.dumps(tool_result),
-                "name": tool_call["name"],
-                "tool_call_id": tool_call["id"],
+                **tool_call,
+                "args": {
+                    **tool_call["args"],
+                    "focus": focus,
+                    "report_id": state.report_id,
+                },
+                "type": "tool_call",
             }
         )
-    return {"messages": outputs}
+        outputs.append(tool_message)
+    novelty, new_urls = governor.measure(outputs, state.seen_urls)
+    return {
+        "messages": outputs,
+        "search_rounds": state.search_rounds + 1,
+        "seen_urls": [*state.seen_urls, *new_urls],
+        "novelty": novelty,
+    }
+
+
+@traced
+async def stop_search(state: SectionWriterState):
+    """Answer the pending tool calls without searching."""
+    return {"messages": governor.decline(state.messages[-1].tool_calls)}
 
 
+@traced
 async def research_model(
     state: SectionWriterState,
     config: RunnableConfig,
@@ -65,20 +91,12 @@ async def research_model(
         overall_topic=state.topic,
     )
 
-    for count in range(_MAX_LLM_RETRIES):
-        messages = [{"role": "system", "content": system_prompt}] + list(state.messages)
-        response = await llm_with_tools.ainvoke(messages, config)
-
-        if response:
-            return {"messages": [response]}
-
-        _LOGGER.debug(
-            "Retrying LLM call. Attempt %d of %d", count + 1, _MAX_LLM_RETRIES
-        )
-
-    raise RuntimeError("Failed to call model after %d attempts.", _MAX_LLM_RETRIES)
+    messages = [{"role": "system", "content": system_prompt}] + list(state.messages)
+    response = await llm_retry.ainvoke(llm_with_tools, messages, config)
+    return {"messages": [response]}
 
 
+@traced
 async def writing_model(
     state: SectionWriterState,
     config: RunnableConfig,
@@ -91,21 +109,13 @@ async def writing_model(
         overall_topic=state.topic,
     )
 
-    for count in range(_MAX_LLM_RETRIES):
-        messages = [{"role": "system", "content": system_prompt}] + list(state.messages)
-        response = await llm.ainvoke(messages, config)
-
-        if response:
-            # Update the section content with the written content
-            updated_section = state.section.model_copy()
-            updated_section.content = str(response.content) if response.content else ""
-            return {"section": updated_section, "messages": [response]}
-
-        _LOGGER.debug(
-            "Retrying LLM call. Attempt %d of %d", count + 1, _MAX_LLM_RETRIES
-        )
+    messages = [{"role": "system", "content": system_prompt}] + list(state.messages)
+    response = await llm_retry.ainvoke(llm, messages, config)
 
-    raise RuntimeError("Failed to call model after %d attempts.", _MAX_LLM_RETRIES)
+    # Update the section content with the written content
+    updated_section = state.section.model_copy()
+    updated_section.content = str(response.content) if response.content else ""
+    return {"section": updated_section, "messages": [response]}
 
 
 def needs_research(state: SectionWriterState) -> str:
@@ -122,10 +132,20 @@ def has_tool_calls(state: SectionWriterState) -> bool:
     return bool(hasattr(last_message, "tool_calls") and last_message.tool_calls)
 
 
+def next_step(state: SectionWriterState) -> str:
+    """Search again, or stop once searches no longer find much that is new."""
+    if not has_tool_calls(state):
+        return "done"
+    if governor.should_search(state.search_rounds, state.novelty):
+        return "search"
+    return "stop"
+
+
 workflow = StateGraph(SectionWriterState)
 
 workflow.add_node("agent", research_model)
 workflow.add_node("tools", tool_node)
+workflow.add_node("stop_search", stop_search)
 workflow.add_node("writer", writing_model)
 
 workflow.add_conditional_edges(
@@ -138,13 +158,15 @@ workflow.add_conditional_edges(
 )
 workflow.add_conditional_edges(
     "agent",
-    has_tool_calls,
+    next_step,
     {
-        True: "tools",
-        False: "writer",
+        "search": "tools",
+        "stop": "stop_search",
+        "done": "writer",
     },
 )
 workflow.add_edge("tools", "agent")
+workflow.add_edge("stop_search", "writer")
 workflow.add_edge("writer", END)
 
 graph = workflow.compile()
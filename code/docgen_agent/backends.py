@@ -0,0 +1,200 @@
+"""Search backends for the report generation workflow."""
+
+import asyncio
+import functools
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Protocol
+
+_LOGGER = logging.getLogger(__name__)
+
+_TEXT_SUFFIXES = frozenset({".md", ".markdown", ".txt", ".rst", ".html", ".htm"})
+_WORD_RE = re.compile(r"\w+")
+_TAG_RE = re.compile(r"<[^>]+>")
+_PASSAGE_CHARS = 1200
+
+
+class SearchBackend(Protocol):
+    """A web search service returning Tavily shaped responses.
+
+    Responses are dicts with a "results" list, where every result has a
+    "title", "url", "content", "score" and optional "raw_content".
+    """
+
+    async def search(
+        self,
+        query: str,
+        *,
+        max_results: int,
+        include_raw_content: bool,
+        topic: str,
+        days: int | None,
+    ) -> dict[str, Any]:
+        """Search for a query."""
+        ...
+
+
+class TavilySearchBackend:
+    """Searches the web with the Tavily API."""
+
+    def __init__(self, api_key: str | None = None) -> None:
+        self.api_key = api_key
+
+    @functools.cached_property
+    def client(self) -> Any:
+        """The Tavily client, created on first use."""
+        from tavily import AsyncTavilyClient
+
+        return AsyncTavilyClient(api_key=self.api_key)
+
+    async def search(
+        self,
+        query: str,
+        *,
+        max_results: int,
+        include_raw_content: bool,
+        topic: str,
+        days: int | None,
+    ) -> dict[str, Any]:
+        return await self.client.search(
+            query,
+            max_results=max_results,
+            include_raw_content=include_raw_content,
+            topic=topic,  # type: ignore[arg-type]
+            days=days,  # type: ignore[arg-type]
+        )
+
+
+class LocalCorpusBackend:
+    """Searches a directory of local documents instead of the web.
+
+    Text, markdown and HTML files under the corpus directory are split into
+    passages and stored in a persistent SQLite FTS5 inverted index. The
+    index is refreshed on first use, re-reading only files that changed.
+    Results are ranked with BM25 and shaped like Tavily results. The topic
+    and days filters do not apply to a local corpus and are ignored.
+    """
+
+    def __init__(self, corpus_dir: str, index_path: str) -> None:
+        self.corpus_dir = Path(corpus_dir).resolve()
+        self.index_path = index_path
+        self._lock = threading.Lock()
+        self._refreshed = False
+
+        if index_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+        self._conn = sqlite3.connect(index_path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, mtime REAL)"
+            )
+            self._conn.execute(
+                """CREATE VIRTUAL TABLE IF NOT EXISTS passages USING fts5(
+                    path UNINDEXED, chunk UNINDEXED, title, content
+                )"""
+            )
+
+    async def search(
+        self,
+        query: str,
+        *,
+        max_results: int,
+        include_raw_content: bool,
+        topic: str,
+        days: int | None,
+    ) -> dict[str, Any]:
+        start = time.monotonic()
+        results = await asyncio.to_thread(
+            self._search, query, max_results, include_raw_content
+        )
+        return {
+            "query": query,
+            "results": results,
+            "response_time": time.monotonic() - start,
+        }
+
+    def refresh(self) -> None:
+        """Index new and changed files, and forget deleted ones."""
+        with self._lock, self._conn:
+            indexed = dict(self._conn.execute("SELECT path, mtime FROM files"))
+            present = set()
+            for path in sorted(self.corpus_dir.rglob("*")):
+                if path.suffix.lower() not in _TEXT_SUFFIXES or not path.is_file():
+                    continue
+                key = str(path)
+                present.add(key)
+                mtime = path.stat().st_mtime
+                if indexed.get(key) == mtime:
+                    continue
+                self._conn.execute("DELETE FROM passages WHERE path = ?", (key,))
+                self._conn.executemany(
+                    "INSERT INTO passages VALUES (?, ?, ?, ?)",
+                    (
+                        (key, chunk, path.stem, passage)
+                        for chunk, passage in enumerate(_passages(path))
+                    ),
+                )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO files VALUES (?, ?)", (key, mtime)
+                )
+                _LOGGER.debug("Indexed %s", key)
+            for key in indexed.keys() - present:
+                self._conn.execute("DELETE FROM passages WHERE path = ?", (key,))
+                self._conn.execute("DELETE FROM files WHERE path = ?", (key,))
+        self._refreshed = True
+
+    def _search(
+        self, query: str, max_results: int, include_raw_content: bool
+    ) -> list[dict[str, Any]]:
+        if not self._refreshed:
+            self.refresh()
+        terms = _WORD_RE.findall(query.lower())
+        if not terms:
+            return []
+        match = " OR ".join(f'"{term}"' for term in terms)
+        with self._lock:
+            rows = self._conn.execute(
+                """SELECT path, chunk, title, content, bm25(passages) AS rank
+                FROM passages WHERE passages MATCH ? ORDER BY rank LIMIT ?""",
+                (match, max_results),
+            ).fetchall()
+
+        results = []
+        for path, chunk, title, content, rank in rows:
+            relevance = -rank
+            result = {
+                "title": title,
+                "url": f"{Path(path).as_uri()}?chunk={chunk}",
+                "content": content,
+                "score": relevance / (1 + relevance),
+            }
+            if include_raw_content:
+                result["raw_content"] = Path(path).read_text(errors="ignore")
+            results.append(result)
+        return results
+
+
+def _passages(path: Path) -> list[str]:
+    """Split a document into passages of about _PASSAGE_CHARS characters."""
+    text = path.read_text(errors="ignore")
+    if path.suffix.lower() in (".html", ".htm"):
+        text = _TAG_RE.sub(" ", text)
+
+    passages: list[str] = []
+    current = ""
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = " ".join(paragraph.split())
+        if not paragraph:
+            continue
+        if current and len(current) + len(paragraph) > _PASSAGE_CHARS:
+            passages.append(current)
+            current = ""
+        current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current:
+        passages.append(current)
+    return passages
@@ -0,0 +1,230 @@
+"""Persistent caches for the report generation workflow."""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Protocol, Sequence
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.load import dumps, loads
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "docgen_agent")
+
+
+@dataclass
+class CacheStats:
+    """Counters describing how well a cache is performing."""
+
+    hits: int = 0
+    misses: int = 0
+    expired: int = 0
+    writes: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def as_dict(self) -> dict[str, Any]:
+        return {**asdict(self), "hit_rate": self.hit_rate}
+
+
+class SearchCache(Protocol):
+    """Interface for caches of search responses."""
+
+    stats: CacheStats
+
+    def get(self, key: tuple[Any, ...]) -> Any | None:
+        """Return the cached value for key, or None if missing or expired."""
+        ...
+
+    def set(self, key: tuple[Any, ...], value: Any, ttl: float) -> None:
+        """Store value under key for ttl seconds."""
+        ...
+
+    def clear(self) -> None:
+        """Remove every entry from the cache."""
+        ...
+
+
+def make_key(key: tuple[Any, ...]) -> str:
+    """Hash a cache key tuple into a stable string."""
+    raw = json.dumps(key, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+# Message fields that never reach the model: LangGraph's random message IDs,
+# tool artifacts and response metadata. They are left out of prompt keys so
+# the same conversation gets the same key on every run.
+_LOCAL_MESSAGE_FIELDS = ("id", "artifact", "response_metadata", "usage_metadata")
+
+
+def prompt_key(prompt: str) -> str:
+    """Drop fields that are not sent to the model from a serialized prompt."""
+    try:
+        messages = json.loads(prompt)
+    except ValueError:
+        return prompt
+    if not isinstance(messages, list):
+        return prompt
+    for message in messages:
+        if isinstance(message, dict) and isinstance(message.get("kwargs"), dict):
+            for field in _LOCAL_MESSAGE_FIELDS:
+                message["kwargs"].pop(field, None)
+    return json.dumps(messages, sort_keys=True)
+
+
+class SqliteCache:
+    """A size bounded, TTL aware cache of JSON values stored in a SQLite file.
+
+    Entries are evicted least-recently-used first once more than
+    max_entries are stored. Expired entries are dropped on read and during
+    eviction.
+    """
+
+    def __init__(self, path: str, max_entries: int = 10_000) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )"""
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at)"
+            )
+
+    def get(self, key: tuple[Any, ...]) -> Any | None:
+        digest = make_key(key)
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM entries WHERE key = ?", (digest,)
+            ).fetchone()
+            if row is None:
+                self.stats.misses += 1
+                return None
+            value, expires_at = row
+            if expires_at <= now:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (digest,))
+                self.stats.expired += 1
+                self.stats.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE entries SET accessed_at = ? WHERE key = ?", (now, digest)
+            )
+        self.stats.hits += 1
+        return json.loads(value)
+
+    def set(self, key: tuple[Any, ...], value: Any, ttl: float) -> None:
+        if ttl <= 0:
+            return
+        digest = make_key(key)
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+                (digest, json.dumps(value), now + ttl, now),
+            )
+            self.stats.writes += 1
+            self._evict(now)
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM entries")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def _evict(self, now: float) -> None:
+        """Drop expired entries, then the least recently used ones over the limit."""
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()
+        if count <= self.max_entries:
+            return
+        removed = self._conn.execute(
+            "DELETE FROM entries WHERE expires_at <= ?", (now,)
+        ).rowcount
+        excess = count - removed - self.max_entries
+        if excess > 0:
+            removed += self._conn.execute(
+                """DELETE FROM entries WHERE key IN (
+                    SELECT key FROM entries ORDER BY accessed_at LIMIT ?
+                )""",
+                (excess,),
+            ).rowcount
+        self.stats.evictions += removed
+        _LOGGER.debug("Evicted %d entries from %s", removed, self.path)
+
+
+class LLMCache(BaseCache):
+    """A persistent LangChain cache for LLM responses.
+
+    Entries are keyed on a hash of the serialized prompt messages and the
+    model's LLM string, which covers the model name, its parameters and any
+    bound tools. With bypass set, cached responses are ignored but fresh
+    responses are still stored.
+    """
+
+    def __init__(self, store: SqliteCache, ttl: float, bypass: bool = False) -> None:
+        self.store = store
+        self.ttl = ttl
+        self.bypass = bypass
+
+    @property
+    def stats(self) -> CacheStats:
+        return self.store.stats
+
+    def lookup(self, prompt: str, llm_string: str) -> RETURN_VAL_TYPE | None:
+        if self.bypass:
+            return None
+        cached = self.store.get((llm_string, prompt_key(prompt)))
+        if cached is None:
+            return None
+        return [loads(generation) for generation in cached]
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Any]) -> None:
+        generations = [dumps(generation) for generation in return_val]
+        self.store.set((llm_string, prompt_key(prompt)), generations, ttl=self.ttl)
+
+    def clear(self, **kwargs: Any) -> None:
+        self.store.clear()
+
+
+# LLM responses are cached on disk, since every docgen model runs at
+# temperature 0. Set LLM_CACHE_PATH to an empty string to disable the cache,
+# or LLM_CACHE_BYPASS=1 to ignore cached responses while refreshing them.
+LLM_CACHE_PATH = os.getenv(
+    "LLM_CACHE_PATH", os.path.join(DEFAULT_CACHE_DIR, "llm.sqlite")
+)
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 60 * 60)))
+
+llm_cache: LLMCache | None = (
+    LLMCache(
+        SqliteCache(LLM_CACHE_PATH, max_entries=LLM_CACHE_MAX_ENTRIES),
+        ttl=LLM_CACHE_TTL,
+        bypass=os.getenv("LLM_CACHE_BYPASS", "0") == "1",
+    )
+    if LLM_CACHE_PATH
+    else None
+)
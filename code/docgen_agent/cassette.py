@@ -0,0 +1,359 @@
+"""Record and replay LLM and search traffic for offline report runs.
+
+Set DOCGEN_CASSETTE to a cassette file and DOCGEN_CASSETTE_MODE to:
+
+    record  call the real endpoints and save every response to the cassette
+    replay  serve every response from the cassette without the network
+
+Requests are matched on a hash of what is sent for them, so a replayed
+run must make the same requests as the recorded one. Search results in a
+prompt are matched whatever order they arrived in. The LLM and search
+caches, the research pool and search hedging are all off while a cassette
+is in use, so every request is seen and none depends on timing. Token
+counts are estimated rather than taken from a tokenizer, so prompts are
+cut the same way whichever tokenizers a machine has, and replays set
+HF_HUB_OFFLINE so they never go to the network.
+
+Failed requests are recorded too, and replayed as RecordedError. Only
+those fall back to the next model of a route. A request that was never
+recorded raises CassetteMissError, which fails the run where it happened.
+
+In replay mode, DOCGEN_CASSETTE_LATENCY injects delays, as a comma
+separated list of kind=distribution, where kind is llm or search:
+
+    recorded           the latency observed when recording
+    fixed:S            S seconds
+    uniform:A:B        uniformly between A and B seconds
+    lognormal:MU:SIGMA a lognormal distribution of seconds
+
+For example "llm=lognormal:0.5:0.4,search=uniform:0.2:1".
+"""
+
+import asyncio
+import atexit
+import functools
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Callable, Literal, Sequence
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun
+from langchain_core.load import dumps, loads
+from langchain_core.messages import BaseMessage, ToolMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+
+from . import sources, tokenizer
+from .backends import SearchBackend
+from .cache import make_key, prompt_key
+from .retry import is_retryable, status_code
+
+_LOGGER = logging.getLogger(__name__)
+
+Mode = Literal["record", "replay"]
+
+# Version 2 records failures, and wraps streams and search responses.
+# Version 3 estimates token counts.
+CASSETTE_VERSION = 3
+Latency = Callable[[float], float]
+
+
+class CassetteMissError(RuntimeError):
+    """A replayed request was never recorded."""
+
+
+class RecordedError(RuntimeError):
+    """A failure replayed from a cassette.
+
+    It keeps the HTTP status and whether the original error was worth
+    retrying, so a replayed run retries and falls back as the recorded one did.
+    """
+
+    def __init__(self, message: str, status: int | None, retryable: bool) -> None:
+        super().__init__(message)
+        self.status_code = status
+        self.response = SimpleNamespace(status_code=status, headers={})
+        self.retryable = retryable
+
+
+def record_error(err: Exception) -> dict[str, Any]:
+    """Describe an error for the cassette."""
+    return {
+        "message": str(err),
+        "status": status_code(err),
+        "retryable": is_retryable(err),
+    }
+
+
+def replay_error(error: dict[str, Any]) -> RecordedError:
+    return RecordedError(error["message"], error["status"], error["retryable"])
+
+
+def parse_latency(spec: str) -> dict[str, Latency]:
+    """Parse a DOCGEN_CASSETTE_LATENCY value into a latency model per kind."""
+    models: dict[str, Latency] = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        kind, _, distribution = item.partition("=")
+        models[kind] = _latency_model(distribution)
+    return models
+
+
+def _latency_model(distribution: str) -> Latency:
+    name, *params = distribution.split(":")
+    args = [float(param) for param in params]
+    if name == "recorded":
+        return lambda recorded: recorded
+    if name == "fixed":
+        (seconds,) = args
+        return lambda _: seconds
+    if name == "uniform":
+        low, high = args
+        return lambda _: random.uniform(low, high)
+    if name == "lognormal":
+        mu, sigma = args
+        return lambda _: random.lognormvariate(mu, sigma)
+    raise ValueError(f"Unknown latency distribution: {distribution}")
+
+
+class Cassette:
+    """Recorded responses, keyed by a hash of the request that produced them.
+
+    Identical requests may be recorded more than once. They are replayed in
+    the order they were recorded, and the last response is reused once
+    they run out.
+    """
+
+    def __init__(
+        self, path: str, mode: Mode, latency: dict[str, Latency] | None = None
+    ) -> None:
+        self.path = path
+        self.mode = mode
+        self.latency = latency or {}
+        self._lock = threading.Lock()
+        self._interactions: dict[str, list[dict[str, Any]]] = defaultdict(list)
+        self._replayed: dict[str, int] = defaultdict(int)
+        if mode == "replay":
+            with open(path, encoding="utf-8") as cassette:
+                recorded = json.load(cassette)
+            if recorded.get("version") != CASSETTE_VERSION:
+                raise ValueError(
+                    f"{path} was recorded in an older format, record it again."
+                )
+            self._interactions.update(recorded["interactions"])
+            _LOGGER.info("Replaying %d requests from %s", len(self), path)
+
+    def __len__(self) -> int:
+        return sum(len(responses) for responses in self._interactions.values())
+
+    def key(self, kind: str, *request: Any) -> str:
+        return f"{kind}:{make_key((kind, *request))}"
+
+    def record(self, key: str, response: Any, latency: float) -> None:
+        with self._lock:
+            self._interactions[key].append({"response": response, "latency": latency})
+
+    async def replay(self, key: str) -> Any:
+        """Return the next recorded response for key, after any injected delay."""
+        with self._lock:
+            responses = self._interactions.get(key)
+            if not responses:
+                raise CassetteMissError(f"No recorded response for {key}")
+            idx = min(self._replayed[key], len(responses) - 1)
+            self._replayed[key] += 1
+        interaction = responses[idx]
+        latency = self.latency.get(key.split(":", 1)[0])
+        if latency is not None:
+            await asyncio.sleep(max(0.0, latency(interaction["latency"])))
+        return interaction["response"]
+
+    def save(self) -> None:
+        if self.mode != "record":
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with self._lock, open(self.path, "w", encoding="utf-8") as cassette:
+            json.dump(
+                {"version": CASSETTE_VERSION, "interactions": self._interactions},
+                cassette,
+            )
+        _LOGGER.info("Recorded %d requests to %s", len(self), self.path)
+
+
+CASSETTE_PATH = os.getenv("DOCGEN_CASSETTE", "")
+CASSETTE_MODE: Mode = (
+    "record" if os.getenv("DOCGEN_CASSETTE_MODE") == "record" else "replay"
+)
+
+active: Cassette | None = (
+    Cassette(
+        CASSETTE_PATH,
+        CASSETTE_MODE,
+        parse_latency(os.getenv("DOCGEN_CASSETTE_LATENCY", "")),
+    )
+    if CASSETTE_PATH
+    else None
+)
+if active is not None:
+    tokenizer.estimate_only()
+    if active.mode == "replay":
+        os.environ["HF_HUB_OFFLINE"] = "1"
+    atexit.register(active.save)
+
+
+def _llm_key(
+    cassette: Cassette, model: str | None, messages: list, **kwargs: Any
+) -> str:
+    return cassette.key("llm", model, prompt_key(dumps(_canonical(messages))), kwargs)
+
+
+def _canonical(messages: list) -> list:
+    """Put the search results in a prompt in a fixed order.
+
+    Searches complete in a different order on every run, so the sources in
+    a tool message are sorted by URL for the key.
+    """
+    canonical = []
+    for message in messages:
+        results = getattr(message, "artifact", None)
+        if isinstance(message, ToolMessage) and isinstance(
+            results, sources.SearchResults
+        ):
+            ordered = sources.SearchResults(
+                sources=sorted(results.sources, key=lambda source: source.url),
+                max_tokens_per_source=results.max_tokens_per_source,
+                note=results.note,
+            )
+            message = message.model_copy(
+                update={"content": ordered.render(), "artifact": None}
+            )
+        canonical.append(message)
+    return canonical
+
+
+@functools.cache
+def chat_model_class() -> type:
+    """Return a ChatNVIDIA subclass that records to or replays from a cassette.
+
+    The class is built on first use, so ChatNVIDIA is only imported when a
+    cassette is active.
+    """
+    from langchain_nvidia_ai_endpoints import ChatNVIDIA
+
+    class CassetteChatNVIDIA(ChatNVIDIA):
+        """ChatNVIDIA that records responses to, or replays them from, a cassette.
+
+        Tool binding and structured output are inherited unchanged, since they
+        only add request parameters, and those are part of the cassette key.
+        """
+
+        async def _agenerate(
+            self,
+            messages: list[BaseMessage],
+            stop: list[str] | None = None,
+            run_manager: AsyncCallbackManagerForLLMRun | None = None,
+            **kwargs: Any,
+        ) -> ChatResult:
+            cassette = _require_cassette()
+            key = _llm_key(cassette, self.model, messages, stop=stop, **kwargs)
+            if cassette.mode == "replay":
+                recorded = await cassette.replay(key)
+                if "error" in recorded:
+                    raise replay_error(recorded["error"])
+                generations = recorded["generations"]
+                return ChatResult(
+                    generations=[loads(generation) for generation in generations],
+                    llm_output=recorded["llm_output"],
+                )
+            start = time.perf_counter()
+            try:
+                result = await super()._agenerate(
+                    messages, stop=stop, run_manager=run_manager, **kwargs
+                )
+            except Exception as err:
+                cassette.record(
+                    key, {"error": record_error(err)}, time.perf_counter() - start
+                )
+                raise
+            cassette.record(
+                key,
+                {
+                    "generations": [
+                        dumps(generation) for generation in result.generations
+                    ],
+                    "llm_output": result.llm_output,
+                },
+                time.perf_counter() - start,
+            )
+            return result
+
+        async def _astream(
+            self,
+            messages: list[BaseMessage],
+            stop: Sequence[str] | None = None,
+            run_manager: AsyncCallbackManagerForLLMRun | None = None,
+            **kwargs: Any,
+        ) -> AsyncIterator[ChatGenerationChunk]:
+            cassette = _require_cassette()
+            key = _llm_key(
+                cassette, self.model, messages, stop=stop, stream=True, **kwargs
+            )
+            if cassette.mode == "replay":
+                recorded = await cassette.replay(key)
+                for chunk in recorded["chunks"]:
+                    yield loads(chunk)
+                if "error" in recorded:
+                    raise replay_error(recorded["error"])
+                return
+            start = time.perf_counter()
+            chunks = []
+            try:
+                async for chunk in super()._astream(
+                    messages, stop=stop, run_manager=run_manager, **kwargs
+                ):
+                    chunks.append(dumps(chunk))
+                    yield chunk
+            except Exception as err:
+                cassette.record(
+                    key,
+                    {"chunks": chunks, "error": record_error(err)},
+                    time.perf_counter() - start,
+                )
+                raise
+            cassette.record(key, {"chunks": chunks}, time.perf_counter() - start)
+
+    return CassetteChatNVIDIA
+
+
+class CassetteSearchBackend:
+    """Records the responses of a search backend, or replays them."""
+
+    def __init__(self, cassette: Cassette, backend: SearchBackend | None) -> None:
+        self.cassette = cassette
+        self.backend = backend
+
+    async def search(self, query: str, **kwargs: Any) -> dict[str, Any]:
+        key = self.cassette.key("search", query, kwargs)
+        if self.cassette.mode == "replay" or self.backend is None:
+            recorded = await self.cassette.replay(key)
+            if "error" in recorded:
+                raise replay_error(recorded["error"])
+            return recorded["response"]
+        start = time.perf_counter()
+        try:
+            response = await self.backend.search(query, **kwargs)
+        except Exception as err:
+            self.cassette.record(
+                key, {"error": record_error(err)}, time.perf_counter() - start
+            )
+            raise
+        self.cassette.record(key, {"response": response}, time.perf_counter() - start)
+        return response
+
+
+def _require_cassette() -> Cassette:
+    if active is None:
+        raise RuntimeError("Set DOCGEN_CASSETTE to use a cassette model.")
+    return active
@@ -0,0 +1,72 @@
+"""Durable checkpoints for resuming report generation runs."""
+
+import contextlib
+import logging
+import os
+from typing import AsyncIterator, Iterable
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import BaseCheckpointSaver
+
+from .cache import DEFAULT_CACHE_DIR
+
+_LOGGER = logging.getLogger(__name__)
+
+# Set DOCGEN_CHECKPOINT_PATH to an empty string to disable checkpointing.
+CHECKPOINT_PATH = os.getenv(
+    "DOCGEN_CHECKPOINT_PATH", os.path.join(DEFAULT_CACHE_DIR, "checkpoints.sqlite")
+)
+# Checkpoints of a run are deleted once it finishes, since only failed runs
+# are resumed. Set DOCGEN_KEEP_CHECKPOINTS=1 to keep them.
+KEEP_CHECKPOINTS = os.getenv("DOCGEN_KEEP_CHECKPOINTS", "0") == "1"
+
+
+@contextlib.asynccontextmanager
+async def checkpointer(
+    path: str = CHECKPOINT_PATH,
+) -> AsyncIterator[BaseCheckpointSaver | None]:
+    """Open the SQLite checkpoint store, or yield None if it is disabled."""
+    if not path:
+        yield None
+        return
+    from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    async with AsyncSqliteSaver.from_conn_string(path) as saver:
+        yield saver
+
+
+def run_config(run_id: str) -> RunnableConfig:
+    """Build the config that checkpoints a report run under its run ID."""
+    return {"configurable": {"thread_id": run_id}}
+
+
+def subgraph_config(config: RunnableConfig, name: str) -> RunnableConfig:
+    """Give a subgraph invocation its own checkpoint thread within the run.
+
+    The section authors all run inside the same orchestrator node, so each
+    needs a distinct thread for its checkpoints. When the run is resumed,
+    subgraphs that already finished return their saved result and the rest
+    continue from their last completed node.
+    """
+    configurable = config.get("configurable", {})
+    thread_id = configurable.get("thread_id")
+    if thread_id is None:
+        return config
+    thread_id = _subgraph_thread(thread_id, name)
+    return {**config, "configurable": {**configurable, "thread_id": thread_id}}
+
+
+async def delete_run(
+    saver: BaseCheckpointSaver, run_id: str, subgraphs: Iterable[str]
+) -> None:
+    """Delete the checkpoints of a finished run and of its named subgraphs."""
+    if KEEP_CHECKPOINTS:
+        return
+    for thread_id in [run_id, *(_subgraph_thread(run_id, name) for name in subgraphs)]:
+        await saver.adelete_thread(thread_id)
+    _LOGGER.debug("Deleted the checkpoints of finished run %s", run_id)
+
+
+def _subgraph_thread(thread_id: str, name: str) -> str:
+    return f"{thread_id}:{name}"
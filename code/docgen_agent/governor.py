@@ -0,0 +1,98 @@
+"""Stops research loops once further searches stop finding anything new."""
+
+import logging
+import os
+from dataclasses import asdict, dataclass
+from typing import Any, Sequence
+
+from langchain_core.messages import ToolMessage
+
+from . import sources
+
+_LOGGER = logging.getLogger(__name__)
+
+# Each research loop may run at most MAX_SEARCH_ROUNDS rounds of tool calls.
+# It also stops once a round adds less than MIN_NOVELTY new content, as a
+# share of the content it returned from sources not seen in the loop before.
+MAX_SEARCH_ROUNDS = int(os.getenv("DOCGEN_MAX_SEARCH_ROUNDS", "3"))
+MIN_NOVELTY = float(os.getenv("DOCGEN_MIN_NOVELTY", "0.25"))
+
+_STOP_MESSAGE = (
+    "No more searches are available. Continue with the research gathered so far."
+)
+
+
+@dataclass
+class GovernorStats:
+    """Counts of the search rounds run and the tool calls declined."""
+
+    rounds: int = 0
+    stopped_low_novelty: int = 0
+    stopped_budget: int = 0
+    saved_searches: int = 0
+    # queries in the declined tool calls
+
+    def as_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+
+class LoopGovernor:
+    """Decides whether a research loop should keep calling its search tools.
+
+    After each round of tool calls, measure() scores how much of the
+    returned content came from sources the loop had not seen. The loop
+    may search again while that novelty stays at or above min_novelty and
+    fewer than max_rounds rounds have run. When it may not, decline()
+    answers the pending tool calls so the model's transcript stays valid.
+    """
+
+    def __init__(self, max_rounds: int, min_novelty: float) -> None:
+        self.max_rounds = max_rounds
+        self.min_novelty = min_novelty
+        self.stats = GovernorStats()
+
+    def measure(
+        self, tool_messages: Sequence[Any], seen_urls: Sequence[str]
+    ) -> tuple[float, list[str]]:
+        """Return the novelty of a round of results and the URLs it added."""
+        self.stats.rounds += 1
+        seen = set(seen_urls)
+        new_urls: list[str] = []
+        total = new = 0
+        for message in tool_messages:
+            artifact = getattr(message, "artifact", None)
+            if not isinstance(artifact, sources.SearchResults):
+                continue
+            for source in artifact.sources:
+                url = sources.canonicalize_url(source.url)
+                size = len(source.content) + len(source.raw_content or "")
+                total += size
+                if url not in seen:
+                    seen.add(url)
+                    new_urls.append(url)
+                    new += size
+        return (new / total if total else 0.0), new_urls
+
+    def should_search(self, rounds: int, novelty: float) -> bool:
+        """Check if a loop that has run rounds rounds may search again."""
+        if rounds >= self.max_rounds:
+            self.stats.stopped_budget += 1
+            _LOGGER.info("Search budget of %d rounds used up.", self.max_rounds)
+            return False
+        if rounds and novelty < self.min_novelty:
+            self.stats.stopped_low_novelty += 1
+            _LOGGER.info("Stopping research, last round was %.0f%% new.", novelty * 100)
+            return False
+        return True
+
+    def decline(self, tool_calls: Sequence[dict[str, Any]]) -> list[ToolMessage]:
+        """Answer tool calls that will not be run."""
+        for tool_call in tool_calls:
+            self.stats.saved_searches += len(tool_call["args"].get("queries") or [0])
+        return [
+            ToolMessage(content=_STOP_MESSAGE, tool_call_id=tool_call["id"])
+            for tool_call in tool_calls
+        ]
+
+
+governor = LoopGovernor(max_rounds=MAX_SEARCH_ROUNDS, min_novelty=MIN_NOVELTY)
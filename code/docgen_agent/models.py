@@ -0,0 +1,159 @@
+"""Model routing for the roles in the report generation workflow.
+
+Each role is served by a list of NIM models, tried in order: the first is
+the primary and the rest are fallbacks used when a call to it fails. The
+routes are set with comma separated model lists in environment variables:
+
+    DOCGEN_PLANNER_MODELS          plans the report
+    DOCGEN_QUERY_GENERATOR_MODELS  writes search queries
+    DOCGEN_WRITER_MODELS           writes the report sections
+
+Calls are tagged with their route, role:model, so the telemetry summary
+reports the latency, tokens and cost of each route. Clients are built the
+first time a route is used, not on import.
+"""
+
+import functools
+import os
+from typing import TYPE_CHECKING, Any, AsyncIterator, Callable, Iterator, Literal
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.runnables import Runnable, RunnableConfig
+
+from . import cassette
+from .cache import llm_cache
+from .telemetry import usage_handler
+from .transport import http_pool
+
+if TYPE_CHECKING:
+    from langchain_nvidia_ai_endpoints import ChatNVIDIA
+
+Role = Literal["planner", "query_generator", "writer"]
+
+LARGE_MODEL = "meta/llama-3.3-70b-instruct"
+SMALL_MODEL = "meta/llama-3.1-8b-instruct"
+
+# Query generation is the highest volume step and the easiest, so it goes
+# to the small model first. Planning and writing stay on the large model.
+_DEFAULT_ROUTES: dict[Role, str] = {
+    "planner": LARGE_MODEL,
+    "query_generator": f"{SMALL_MODEL},{LARGE_MODEL}",
+    "writer": LARGE_MODEL,
+}
+
+ROUTES: dict[Role, list[str]] = {
+    role: [
+        model.strip()
+        for model in os.getenv(f"DOCGEN_{role.upper()}_MODELS", default).split(",")
+        if model.strip()
+    ]
+    for role, default in _DEFAULT_ROUTES.items()
+}
+
+
+def primary_model(role: Role) -> str:
+    """Return the model that serves a role while its calls succeed."""
+    return ROUTES[role][0]
+
+
+@functools.cache
+def chat_model(model: str) -> "ChatNVIDIA":
+    """Return the shared client for a NIM model.
+
+    Clients for every model send their requests through the shared HTTP
+    connection pool.
+    """
+    if cassette.active is not None:
+        # Every request has to reach the cassette, so skip the LLM cache.
+        return http_pool.attach(
+            cassette.chat_model_class()(
+                model=model, temperature=0, cache=False, callbacks=[usage_handler]
+            )
+        )
+
+    from langchain_nvidia_ai_endpoints import ChatNVIDIA
+
+    return http_pool.attach(
+        ChatNVIDIA(
+            model=model,
+            temperature=0,
+            cache=llm_cache,
+            callbacks=[usage_handler],
+        )
+    )
+
+
+class LazyRoute(Runnable):
+    """A model route that builds its runnable the first time it is called.
+
+    Only calls build the route. Looking up an attribute, as LangGraph does
+    for the names in node closures when a graph is compiled, does not, so
+    importing the workflow creates no clients.
+    """
+
+    def __init__(
+        self, role: Role, bind: Callable[[BaseChatModel], Runnable] | None = None
+    ) -> None:
+        self.role = role
+        self._bind = bind
+
+    @functools.cached_property
+    def runnable(self) -> Runnable:
+        return build_route(self.role, self._bind)
+
+    def invoke(
+        self, input: Any, config: RunnableConfig | None = None, **kwargs: Any
+    ) -> Any:
+        return self.runnable.invoke(input, config, **kwargs)
+
+    async def ainvoke(
+        self, input: Any, config: RunnableConfig | None = None, **kwargs: Any
+    ) -> Any:
+        return await self.runnable.ainvoke(input, config, **kwargs)
+
+    def stream(
+        self, input: Any, config: RunnableConfig | None = None, **kwargs: Any
+    ) -> Iterator[Any]:
+        yield from self.runnable.stream(input, config, **kwargs)
+
+    async def astream(
+        self, input: Any, config: RunnableConfig | None = None, **kwargs: Any
+    ) -> AsyncIterator[Any]:
+        async for chunk in self.runnable.astream(input, config, **kwargs):
+            yield chunk
+
+
+def route(
+    role: Role, bind: Callable[[BaseChatModel], Runnable] | None = None
+) -> LazyRoute:
+    """Return the runnable serving a role, built when it is first used."""
+    return LazyRoute(role, bind)
+
+
+def build_route(
+    role: Role, bind: Callable[[BaseChatModel], Runnable] | None = None
+) -> Runnable:
+    """Build the runnable serving a role, falling back through its models.
+
+    bind adapts each model before the fallbacks are chained, for example
+    to bind tools or request structured output, since the fallback chain
+    itself cannot be bound.
+    """
+    runnables = []
+    for model in ROUTES[role]:
+        runnable = chat_model(model) if bind is None else bind(chat_model(model))
+        runnables.append(
+            runnable.with_config(metadata={"docgen_route": f"{role}:{model}"})
+        )
+    if not runnables:
+        raise ValueError(f"No models are configured for the {role} role.")
+    primary, *fallbacks = runnables
+    if not fallbacks:
+        return primary
+    if cassette.active is not None and cassette.active.mode == "replay":
+        # Fall back only where the recorded run did. A request that was never
+        # recorded must fail rather than be retried on the next model.
+        return primary.with_fallbacks(
+            fallbacks, exceptions_to_handle=(cassette.RecordedError,)
+        )
+    return primary.with_fallbacks(fallbacks)
@@ -0,0 +1,95 @@
+"""A shared pool of the research gathered while writing a report."""
+
+import logging
+import re
+from collections import defaultdict
+from typing import Any
+
+from . import sources
+
+_LOGGER = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r"\w+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from how in is it of on or the to vs what "
+    "when where which who why with".split()
+)
+
+# A query is answered from the pool when at least MIN_MATCHES sources
+# mention MIN_COVERAGE of its terms.
+MIN_MATCHES = 3
+MIN_COVERAGE = 0.6
+
+
+class ResearchPool:
+    """Every source retrieved for one report, searchable by keyword.
+
+    The researcher seeds the pool during topic research, and every search
+    made by a section author adds to it. Before searching the web, a query
+    is checked against the pool and answered from it if enough sources
+    already cover the query.
+    """
+
+    def __init__(self) -> None:
+        self._sources: list[dict[str, Any]] = []
+        self._urls: set[str] = set()
+        self._postings: dict[str, set[int]] = defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self._sources)
+
+    def add(self, results: list[dict[str, Any]]) -> None:
+        """Add search results to the pool, skipping URLs already present."""
+        for result in results:
+            url = sources.canonicalize_url(result["url"])
+            if url in self._urls:
+                continue
+            self._urls.add(url)
+            idx = len(self._sources)
+            self._sources.append(result)
+            for term in _terms(f"{result.get('title')} {result.get('content')}"):
+                self._postings[term].add(idx)
+
+    def search(self, query: str, max_results: int) -> dict[str, Any] | None:
+        """Answer a query from the pool with a Tavily shaped response.
+
+        Returns None if the pool does not cover the query well enough.
+        """
+        terms = _terms(query)
+        if not terms:
+            return None
+        hits: dict[int, int] = defaultdict(int)
+        for term in terms:
+            for idx in self._postings.get(term, ()):
+                hits[idx] += 1
+        matches = [
+            idx for idx, count in hits.items() if count / len(terms) >= MIN_COVERAGE
+        ]
+        if len(matches) < MIN_MATCHES:
+            return None
+
+        candidates = [self._sources[idx] for idx in matches]
+        _LOGGER.info("Answering query from the research pool: %s", query)
+        return {
+            "query": query,
+            "results": sources.rerank(candidates, query, max_results),
+        }
+
+
+def _terms(text: str) -> set[str]:
+    return {word for word in _WORD_RE.findall(text.lower()) if word not in _STOPWORDS}
+
+
+_pools: dict[str, ResearchPool] = {}
+
+
+def get_pool(report_id: str) -> ResearchPool:
+    """Return the research pool for a report, creating it if needed."""
+    if report_id not in _pools:
+        _pools[report_id] = ResearchPool()
+    return _pools[report_id]
+
+
+def release_pool(report_id: str) -> None:
+    """Forget the research pool for a finished report."""
+    _pools.pop(report_id, None)
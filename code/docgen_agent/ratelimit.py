@@ -0,0 +1,269 @@
+"""Rate limiting for outbound API traffic."""
+
+import abc
+import asyncio
+import contextlib
+import contextvars
+import logging
+import os
+import re
+import time
+from collections import deque
+from typing import AsyncIterator, Hashable
+
+_LOGGER = logging.getLogger(__name__)
+
+_STATUS_RE = re.compile(r"\s*\[(429|503)\]")
+
+# The job a request is made for. Waiting requests are granted slots in
+# round robin order across jobs, so one busy job cannot starve the others.
+current_job: contextvars.ContextVar[Hashable] = contextvars.ContextVar(
+    "current_job", default=None
+)
+
+
+class _FairSlots(abc.ABC):
+    """A pool of request slots shared fairly between jobs.
+
+    A request takes a free slot at once unless others are already waiting.
+    Waiting requests are queued per job in current_job, and freed slots are
+    handed out to each waiting job in turn.
+    """
+
+    def __init__(self) -> None:
+        self.in_flight = 0
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._waiters: dict[Hashable, deque[asyncio.Future]] = {}
+
+    @abc.abstractmethod
+    def _capacity(self) -> int:
+        """Return how many requests may be in flight at once."""
+
+    async def _acquire(self) -> None:
+        """Take a free slot, or queue behind the current job's earlier requests."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._waiters = {}
+        if not self._waiters and self.in_flight < self._capacity():
+            self.in_flight += 1
+            return
+        waiter = loop.create_future()
+        self._waiters.setdefault(current_job.get(), deque()).append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            # The slot was granted just as the request was cancelled.
+            if waiter.done() and not waiter.cancelled():
+                self._release()
+            raise
+
+    def _release(self) -> None:
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        """Grant free slots to waiting requests, one job at a time."""
+        while self._waiters and self.in_flight < self._capacity():
+            job = next(iter(self._waiters))
+            queue = self._waiters.pop(job)
+            waiter = queue.popleft()
+            if queue:
+                # Move the job to the back of the line.
+                self._waiters[job] = queue
+            if waiter.done():
+                continue
+            self.in_flight += 1
+            waiter.set_result(None)
+
+
+class AdaptiveRateLimiter(_FairSlots):
+    """An async token bucket with a concurrency cap that adapts to 429s.
+
+    Callers hold the limiter for the duration of a request:
+
+        async with limiter:
+            response = await client.call()
+        limiter.on_success()
+
+    Every rate limited response halves the request rate and pauses new
+    requests for the Retry-After interval. After ramp_after consecutive
+    successes the rate grows additively back towards max_rate. When
+    requests have to wait, they are let through in turn for each job in
+    current_job.
+    """
+
+    def __init__(
+        self,
+        max_rate: float,
+        max_concurrency: int,
+        min_rate: float = 0.2,
+        ramp_after: int = 10,
+    ) -> None:
+        super().__init__()
+        self.max_rate = max_rate
+        self.min_rate = min(min_rate, max_rate)
+        self.max_concurrency = max_concurrency
+        self.ramp_after = ramp_after
+        self.rate = max_rate
+        self.rate_limited = 0
+
+        self._tokens = max(1.0, max_rate)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._successes = 0
+        self._token_loop: asyncio.AbstractEventLoop | None = None
+        self._token_lock: asyncio.Lock | None = None
+
+    async def __aenter__(self) -> "AdaptiveRateLimiter":
+        await self._acquire()
+        try:
+            # Slots are granted fairly, and the lock hands out tokens in the
+            # order the slots were granted.
+            async with self._get_token_lock():
+                await self._take_token()
+        except BaseException:
+            self._release()
+            raise
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self._release()
+
+    def on_success(self) -> None:
+        """Record a successful request and ramp the rate back up."""
+        self._successes += 1
+        if self.rate < self.max_rate and self._successes >= self.ramp_after:
+            self._successes = 0
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 10)
+            _LOGGER.debug("Increased request rate to %.2f/s", self.rate)
+
+    def on_rate_limited(self, retry_after: float | None = None) -> None:
+        """Record a rate limited request and back off."""
+        self.rate_limited += 1
+        self._successes = 0
+        self.rate = max(self.min_rate, self.rate / 2)
+        self._tokens = 0.0
+        pause = retry_after if retry_after is not None else 1 / self.rate
+        self._paused_until = max(self._paused_until, time.monotonic() + pause)
+        _LOGGER.warning(
+            "Rate limited, backing off to %.2f requests/s for %.1fs", self.rate, pause
+        )
+
+    def _capacity(self) -> int:
+        return self.max_concurrency
+
+    def _get_token_lock(self) -> asyncio.Lock:
+        """Return the token bucket lock for the running event loop."""
+        loop = asyncio.get_running_loop()
+        if self._token_lock is None or self._token_loop is not loop:
+            self._token_loop = loop
+            self._token_lock = asyncio.Lock()
+        return self._token_lock
+
+    async def _take_token(self) -> None:
+        """Wait until the bucket holds a token, then consume it."""
+        while True:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            capacity = max(1.0, self.rate)
+            self._tokens = min(
+                capacity, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+def is_overloaded(err: BaseException) -> bool:
+    """Check if an error means the endpoint is overloaded.
+
+    That is an HTTP 429 or 503 response, or a timeout.
+    """
+    if isinstance(err, (TimeoutError, asyncio.TimeoutError)):
+        return True
+    if "timeout" in type(err).__name__.lower():
+        return True
+    status = getattr(err, "status_code", None) or getattr(
+        getattr(err, "response", None), "status_code", None
+    )
+    if status in (429, 503):
+        return True
+    # langchain_nvidia_ai_endpoints raises plain exceptions like "[429] ..."
+    return bool(_STATUS_RE.match(str(err)))
+
+
+class AIMDLimiter(_FairSlots):
+    """Caps concurrent requests with additive increase, multiplicative decrease.
+
+    Each successful request raises the limit by increase / limit, so the
+    limit grows by about `increase` for every window of successes. An
+    overloaded response halves the limit. Requests that started before the
+    last decrease cannot decrease it again, so a burst of failures from the
+    same overload only halves the limit once. When requests have to wait,
+    slots are handed out in turn to each job in current_job.
+
+        async with limiter.slot():
+            response = await llm.ainvoke(messages)
+    """
+
+    def __init__(
+        self,
+        initial: float,
+        min_limit: float = 1,
+        max_limit: float = 64,
+        increase: float = 1,
+    ) -> None:
+        super().__init__()
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.limit = min(max(initial, min_limit), max_limit)
+        self.overloaded = 0
+
+        self._generation = 0
+
+    @contextlib.asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Hold one request slot for the duration of the block."""
+        await self._acquire()
+        generation = self._generation
+        try:
+            yield
+        except Exception as err:
+            if is_overloaded(err):
+                self._on_overload(generation)
+            raise
+        else:
+            self.limit = min(self.max_limit, self.limit + self.increase / self.limit)
+        finally:
+            self._release()
+
+    def _capacity(self) -> int:
+        return int(self.limit)
+
+    def _on_overload(self, generation: int) -> None:
+        self.overloaded += 1
+        if generation != self._generation:
+            return
+        self._generation += 1
+        self.limit = max(self.min_limit, self.limit / 2)
+        _LOGGER.warning("Endpoint overloaded, reducing concurrency to %d", self.limit)
+
+
+# Every LLM call in the process shares one limiter. THROTTLE_LLM_CALLS=1 starts
+# it at a single request at a time, growing as the endpoint keeps up.
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+LLM_INITIAL_CONCURRENCY = (
+    1
+    if os.getenv("THROTTLE_LLM_CALLS", "0") == "1"
+    else int(os.getenv("LLM_INITIAL_CONCURRENCY", "8"))
+)
+
+llm_limiter = AIMDLimiter(
+    initial=LLM_INITIAL_CONCURRENCY, max_limit=LLM_MAX_CONCURRENCY
+)
@@ -1,21 +1,22 @@
-import json
 import logging
 from typing import Annotated, Any, Sequence
 
 from langchain_core.runnables import RunnableConfig
-from langchain_nvidia_ai_endpoints import ChatNVIDIA
 from langgraph.graph import END, START, StateGraph
 from langgraph.graph.message import add_messages
 from pydantic import BaseModel
 
-from . import tools
+from . import models, tools
+from .governor import governor
 from .prompts import research_prompt
+from .retry import llm_retry
+from .telemetry import traced
 
 _LOGGER = logging.getLogger(__name__)
-_MAX_LLM_RETRIES = 3
 
-llm = ChatNVIDIA(model="meta/llama-3.3-70b-instruct", temperature=0)
-llm_with_tools = llm.bind_tools([tools.search_tavily])
+llm_with_tools = models.route(
+    "query_generator", lambda llm: llm.bind_tools([tools.search_tavily])
+)
 
 
 class ResearcherState(BaseModel):
@@ -23,28 +24,55 @@ class ResearcherState(BaseModel):
     # the topic to be researched
     number_of_queries: int = 5
     # how many searches should be done per topic?
+    report_id: str | None = None
+    # the report whose research pool to seed
     messages: Annotated[Sequence[Any], add_messages] = []
     # a chat log of the research results
+    search_rounds: int = 0
+    # how many rounds of tool calls have run?
+    seen_urls: list[str] = []
+    # the sources found so far
+    novelty: float = 1.0
+    # the share of new content in the last round of results
 
 
+@traced
 async def tool_node(state: ResearcherState):
     _LOGGER.info("Executing tool calls.")
     outputs = []
     for tool_call in state.messages[-1].tool_calls:
         _LOGGER.info("Executing tool call: %s", tool_call["name"])
         tool = getattr(tools, tool_call["name"])
-        tool_result = await tool.ainvoke(tool_call["args"])
-        outputs.append(
+        # Invoking the tool with the whole tool call returns a ToolMessage
+        # carrying the rendered results and the structured sources.
+        tool_message = await tool.ainvoke(
             {
-                "role": "tool",
-                "content": json.dumps(tool_result),
-                "name": tool_call["name"],
-                "tool_call_id": tool_call["id"],
+                **tool_call,
+                "args": {
+                    **tool_call["args"],
+                    "focus": state.topic,
+                    "report_id": state.report_id,
+                },
+                "type": "tool_call",
             }
         )
-    return {"messages": outputs}
+        outputs.append(tool_message)
+    novelty, new_urls = governor.measure(outputs, state.seen_urls)
+    return {
+        "messages": outputs,
+        "search_rounds": state.search_rounds + 1,
+        "seen_urls": [*state.seen_urls, *new_urls],
+        "novelty": novelty,
+    }
+
+
+@traced
+async def stop_search(state: ResearcherState):
+    """Answer the pending tool calls without searching."""
+    return {"messages": governor.decline(state.messages[-1].tool_calls)}
 
 
+@traced
 async def call_model(
     state: ResearcherState,
     config: RunnableConfig,
@@ -54,18 +82,9 @@ async def call_model(
         topic=state.topic, number_of_queries=state.number_of_queries
     )
 
-    for count in range(_MAX_LLM_RETRIES):
-        messages = [{"role": "system", "content": system_prompt}] + list(state.messages)
-        response = await llm_with_tools.ainvoke(messages, config)
-
-        if response:
-            return {"messages": [response]}
-
-        _LOGGER.debug(
-            "Retrying LLM call. Attempt %d of %d", count + 1, _MAX_LLM_RETRIES
-        )
-
-    raise RuntimeError("Failed to call model after %d attempts.", _MAX_LLM_RETRIES)
+    messages = [{"role": "system", "content": system_prompt}] + list(state.messages)
+    response = await llm_retry.ainvoke(llm_with_tools, messages, config)
+    return {"messages": [response]}
 
 
 def has_tool_calls(state: ResearcherState) -> bool:
@@ -75,19 +94,31 @@ def has_tool_calls(state: ResearcherState) -> bool:
     return bool(last_message.tool_calls)
 
 
+def next_step(state: ResearcherState) -> str:
+    """Search again, or stop once searches no longer find much that is new."""
+    if not has_tool_calls(state):
+        return "done"
+    if governor.should_search(state.search_rounds, state.novelty):
+        return "search"
+    return "stop"
+
+
 workflow = StateGraph(ResearcherState)
 
 workflow.add_node("agent", call_model)
 workflow.add_node("tools", tool_node)
+workflow.add_node("stop_search", stop_search)
 
 workflow.add_edge(START, "agent")
 workflow.add_conditional_edges(
     "agent",
-    has_tool_calls,
+    next_step,
     {
-        True: "tools",
-        False: END,
+        "search": "tools",
+        "stop": "stop_search",
+        "done": END,
     },
 )
 workflow.add_edge("tools", "agent")
+workflow.add_edge("stop_search", END)
 graph = workflow.compile()
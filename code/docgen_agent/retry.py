@@ -0,0 +1,144 @@
+"""Retrying LLM calls that fail for transient reasons."""
+
+import asyncio
+import email.utils
+import logging
+import os
+import random
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator
+
+from langchain_core.runnables import Runnable, RunnableConfig
+
+from .ratelimit import is_overloaded, llm_limiter
+from .telemetry import tracer
+
+_LOGGER = logging.getLogger(__name__)
+
+_RETRYABLE_STATUSES = frozenset({408, 409, 425, 429, 500, 502, 503, 504})
+
+
+class EmptyResponseError(RuntimeError):
+    """The model returned no response."""
+
+
+def status_code(err: BaseException) -> int | None:
+    """Return the HTTP status attached to an error, if there is one."""
+    status = getattr(err, "status_code", None) or getattr(
+        getattr(err, "response", None), "status_code", None
+    )
+    return status if isinstance(status, int) else None
+
+
+def is_retryable(err: BaseException) -> bool:
+    """Check if an error is worth retrying.
+
+    Overloads, server errors, timeouts, dropped connections and empty
+    responses are transient. Anything else, such as a bad request or a
+    failed authentication, will fail the same way again.
+    """
+    # Errors replayed from a cassette say whether the original was retried.
+    retryable = getattr(err, "retryable", None)
+    if isinstance(retryable, bool):
+        return retryable
+    if isinstance(err, (EmptyResponseError, ConnectionError)) or is_overloaded(err):
+        return True
+    if status_code(err) in _RETRYABLE_STATUSES:
+        return True
+    name = type(err).__name__.lower()
+    return "connect" in name or "protocol" in name
+
+
+def retry_after(err: BaseException) -> float | None:
+    """Return how long the Retry-After header of an error asks us to wait."""
+    headers = getattr(getattr(err, "response", None), "headers", None)
+    value = headers.get("Retry-After") if headers is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """Retry transient failures with capped exponential backoff.
+
+    Delays are drawn with full jitter, uniformly between zero and
+    base_delay * 2 ** attempt, so callers that failed together do not
+    retry together. A Retry-After header sets the minimum delay.
+    """
+
+    attempts: int = 5
+    base_delay: float = 1.0
+    max_delay: float = 60.0
+
+    def delay(self, attempt: int, err: BaseException) -> float:
+        """Return how long to wait before retrying after the given attempt."""
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+        return max(backoff, retry_after(err) or 0.0)
+
+    async def ainvoke(
+        self, model: Runnable, messages: list[Any], config: RunnableConfig | None
+    ) -> Any:
+        """Invoke a model under the shared LLM limiter, retrying transient errors."""
+        for attempt in range(self.attempts):
+            try:
+                async with llm_limiter.slot():
+                    with tracer.span("llm", "llm", attempt=attempt):
+                        response = await model.ainvoke(messages, config)
+                if not response:
+                    raise EmptyResponseError("The model returned an empty response.")
+                return response
+            except Exception as err:
+                if attempt + 1 >= self.attempts or not is_retryable(err):
+                    raise
+                await self._backoff(attempt, err)
+        raise RuntimeError(f"Failed to call model after {self.attempts} attempts.")
+
+    async def astream(
+        self, model: Runnable, messages: list[Any], config: RunnableConfig | None
+    ) -> AsyncIterator[Any]:
+        """Stream a model's output under the shared LLM limiter.
+
+        Output that was already yielded cannot be taken back, so the stream
+        is only retried if it fails before yielding anything.
+        """
+        for attempt in range(self.attempts):
+            started = False
+            try:
+                async with llm_limiter.slot():
+                    with tracer.span("llm.stream", "llm", attempt=attempt):
+                        async for chunk in model.astream(messages, config):
+                            started = True
+                            yield chunk
+                if not started:
+                    raise EmptyResponseError("The model returned an empty response.")
+                return
+            except Exception as err:
+                if started or attempt + 1 >= self.attempts or not is_retryable(err):
+                    raise
+                await self._backoff(attempt, err)
+        raise RuntimeError(f"Failed to call model after {self.attempts} attempts.")
+
+    async def _backoff(self, attempt: int, err: BaseException) -> None:
+        tracer.add_retry()
+        delay = self.delay(attempt, err)
+        _LOGGER.warning(
+            "LLM call failed (%s), retrying in %.1fs. Attempt %d of %d",
+            err,
+            delay,
+            attempt + 1,
+            self.attempts,
+        )
+        await asyncio.sleep(delay)
+
+
+llm_retry = RetryPolicy(attempts=int(os.getenv("LLM_MAX_RETRIES", "5")))
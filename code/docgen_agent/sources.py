@@ -0,0 +1,414 @@
+"""Helpers for cleaning up search result sources."""
+
+import hashlib
+import math
+import re
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from typing import Any, Iterable
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from . import tokenizer
+
+# Query parameters that only track where a visitor came from.
+_TRACKING_PARAMS = frozenset(
+    {
+        "fbclid",
+        "gclid",
+        "dclid",
+        "msclkid",
+        "igshid",
+        "mc_cid",
+        "mc_eid",
+        "ref",
+        "ref_src",
+        "ref_url",
+        "spm",
+        "cmpid",
+        "amp",
+        "outputtype",
+        "_ga",
+        "_gl",
+    }
+)
+_TRACKING_PREFIXES = ("utm_", "pk_", "hsa_")
+_HOST_PREFIXES = ("www.", "amp.", "m.", "mobile.")
+_WORD_RE = re.compile(r"\w+")
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+
+SIMHASH_BITS = 64
+NEAR_DUPLICATE_DISTANCE = 7
+_BANDS = NEAR_DUPLICATE_DISTANCE + 1
+_BAND_BITS = SIMHASH_BITS // _BANDS
+_BAND_MASK = (1 << _BAND_BITS) - 1
+
+# SimHash needs a per-bit sum over every feature hash. Rather than loop over
+# 64 bits per feature, each hash is "spread" into a big integer with one
+# 20 bit counter per hash bit, so summing features is a single big int add.
+_COUNTER_BITS = 20
+_COUNTER_MASK = (1 << _COUNTER_BITS) - 1
+_SPREAD_BYTE = [
+    sum(((byte >> bit) & 1) << (bit * _COUNTER_BITS) for bit in range(8))
+    for byte in range(256)
+]
+
+
+@dataclass(frozen=True, slots=True)
+class Source:
+    """A single search result."""
+
+    title: str
+    url: str
+    content: str
+    score: float = 0.0
+    raw_content: str | None = None
+    # only set when the raw page content was requested
+
+    @classmethod
+    def from_result(cls, result: dict[str, Any], include_raw_content: bool):
+        """Build a source from a Tavily shaped search result."""
+        return cls(
+            title=result.get("title") or "",
+            url=result["url"],
+            content=result.get("content") or "",
+            score=float(result.get("score") or 0.0),
+            raw_content=(result.get("raw_content") or "")
+            if include_raw_content
+            else None,
+        )
+
+
+@dataclass(slots=True)
+class SearchResults:
+    """Search results that are rendered into prompt text only when needed."""
+
+    sources: list[Source] = field(default_factory=list)
+    max_tokens_per_source: int = 0
+    note: str = ""
+
+    def render(self) -> str:
+        """Render the sources for a prompt in a single pass."""
+        parts = ["Sources:\n\n"]
+        for source in self.sources:
+            parts.append(
+                f"Source {source.title}:\n===\n"
+                f"URL: {source.url}\n===\n"
+                f"Most relevant content from source: {source.content}\n===\n"
+            )
+            if source.raw_content is not None:
+                parts.append(
+                    f"Full source content limited to {self.max_tokens_per_source} "
+                    f"tokens: {source.raw_content}\n\n"
+                )
+        text = "".join(parts).strip()
+        if self.note:
+            text = f"{text}\n\n{self.note}"
+        return text
+
+    __str__ = render
+
+
+def canonicalize_url(url: str) -> str:
+    """Reduce a URL to a canonical form shared by its trivial variants.
+
+    The scheme, common mobile/AMP host prefixes, default ports, fragments,
+    trailing slashes, AMP path suffixes and tracking parameters are dropped
+    and the remaining query parameters are sorted.
+    """
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or "").lower()
+    for prefix in _HOST_PREFIXES:
+        if host.startswith(prefix):
+            host = host[len(prefix) :]
+            break
+    if parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+
+    path = parts.path
+    for suffix in ("/amp", "/amp/", ".amp", "/index.html"):
+        if path.endswith(suffix):
+            path = path[: -len(suffix)]
+    path = path.rstrip("/")
+
+    query = sorted(
+        (key, value)
+        for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in _TRACKING_PARAMS
+        and not key.lower().startswith(_TRACKING_PREFIXES)
+    )
+
+    canonical = host + path
+    if query:
+        canonical += "?" + urlencode(query)
+    return canonical
+
+
+def simhash(text: str) -> int:
+    """Compute a 64 bit SimHash over the word 3-shingles of text."""
+    words = _WORD_RE.findall(text.lower())
+    if len(words) >= 3:
+        features = [" ".join(words[i : i + 3]) for i in range(len(words) - 2)]
+    else:
+        features = words
+    if not features:
+        return 0
+
+    total = 0
+    for feature in features:
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+        for index, byte in enumerate(digest):
+            total += _SPREAD_BYTE[byte] << (index * 8 * _COUNTER_BITS)
+
+    threshold = len(features) / 2
+    fingerprint = 0
+    for bit in range(SIMHASH_BITS):
+        if (total >> (bit * _COUNTER_BITS)) & _COUNTER_MASK > threshold:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+class NearDuplicateIndex:
+    """Finds fingerprints within NEAR_DUPLICATE_DISTANCE bits of a seen one.
+
+    Fingerprints are split into NEAR_DUPLICATE_DISTANCE + 1 bands. Any two
+    fingerprints within the distance must agree exactly on at least one
+    band, so only fingerprints sharing a band need to be compared.
+    """
+
+    def __init__(self) -> None:
+        self._bands: list[dict[int, list[int]]] = [{} for _ in range(_BANDS)]
+
+    def add(self, fingerprint: int) -> bool:
+        """Add a fingerprint, returning False if it is a near duplicate."""
+        keys = [
+            (fingerprint >> (band * _BAND_BITS)) & _BAND_MASK for band in range(_BANDS)
+        ]
+        for band, key in enumerate(keys):
+            for other in self._bands[band].get(key, ()):
+                if (fingerprint ^ other).bit_count() <= NEAR_DUPLICATE_DISTANCE:
+                    return False
+        for band, key in enumerate(keys):
+            self._bands[band].setdefault(key, []).append(fingerprint)
+        return True
+
+
+class Deduplicator:
+    """Incrementally drops sources that repeat an earlier source.
+
+    A source is a duplicate if its canonical URL matches an earlier source,
+    or if its content is a near duplicate of an earlier source's content.
+    The first occurrence, which Tavily ranks highest, is kept.
+    """
+
+    def __init__(self) -> None:
+        self._seen_urls: set[str] = set()
+        self._index = NearDuplicateIndex()
+
+    def filter(self, sources: Iterable[dict[str, Any]]) -> list[dict[str, Any]]:
+        """Return the sources that have not been seen before."""
+        unique = []
+        for source in sources:
+            url = canonicalize_url(source["url"])
+            if url in self._seen_urls:
+                continue
+            self._seen_urls.add(url)
+            content = source.get("content") or ""
+            if content and not self._index.add(simhash(content)):
+                continue
+            unique.append(source)
+        return unique
+
+
+def deduplicate(sources: Iterable[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Drop sources that repeat an earlier source."""
+    return Deduplicator().filter(sources)
+
+
+def bm25_scores(
+    query: str, documents: list[str], k1: float = 1.5, b: float = 0.75
+) -> list[float]:
+    """Score documents against a query with Okapi BM25.
+
+    The index is built in memory over just these documents, which is enough
+    to rank one batch of search results.
+    """
+    tokenized = [_WORD_RE.findall(document.lower()) for document in documents]
+    if not tokenized:
+        return []
+    average_length = sum(len(words) for words in tokenized) / len(tokenized) or 1.0
+    document_frequency: Counter[str] = Counter()
+    for words in tokenized:
+        document_frequency.update(set(words))
+
+    terms = set(_WORD_RE.findall(query.lower()))
+    idf = {
+        term: math.log(
+            1
+            + (len(tokenized) - document_frequency[term] + 0.5)
+            / (document_frequency[term] + 0.5)
+        )
+        for term in terms
+        if document_frequency[term]
+    }
+
+    scores = []
+    for words in tokenized:
+        frequencies = Counter(words)
+        norm = k1 * (1 - b + b * len(words) / average_length)
+        scores.append(
+            sum(
+                weight * frequencies[term] * (k1 + 1) / (frequencies[term] + norm)
+                for term, weight in idf.items()
+                if frequencies[term]
+            )
+        )
+    return scores
+
+
+def rerank(
+    sources: list[dict[str, Any]], query: str, top_k: int
+) -> list[dict[str, Any]]:
+    """Order sources by BM25 relevance to query and keep the top_k."""
+    documents = [
+        f"{source.get('title') or ''} {source.get('content') or ''}"
+        for source in sources
+    ]
+    scores = bm25_scores(query, documents)
+    ranked = sorted(range(len(sources)), key=lambda i: scores[i], reverse=True)
+    return [sources[i] for i in ranked[:top_k]]
+
+
+def allocate_budget(demands: list[int], weights: list[float], budget: int) -> list[int]:
+    """Split a token budget across sources in proportion to their weights.
+
+    No source receives more than it demands. Budget left over by sources
+    that need less than their share is shared out again among the rest.
+    """
+    weights = [max(weight, 1e-6) for weight in weights]
+    allocations = [0] * len(demands)
+    active = [i for i, demand in enumerate(demands) if demand > 0]
+    remaining = budget
+    while active and remaining > 0:
+        total_weight = sum(weights[i] for i in active)
+        shares = {i: remaining * weights[i] / total_weight for i in active}
+        satisfied = [i for i in active if demands[i] - allocations[i] <= shares[i]]
+        if not satisfied:
+            for i in active:
+                allocations[i] += int(shares[i])
+            break
+        for i in satisfied:
+            remaining -= demands[i] - allocations[i]
+            allocations[i] = demands[i]
+        active = [i for i in active if i not in satisfied]
+    return allocations
+
+
+def truncate_sentences(text: str, max_tokens: int, model: str) -> str:
+    """Cut text down to max_tokens, ending on a sentence boundary if possible."""
+    if max_tokens <= 0:
+        return ""
+    sentences = _SENTENCE_END_RE.split(text)
+    counts = tokenizer.count_tokens_batch(sentences, model)
+    if sum(counts) <= max_tokens:
+        return text
+
+    kept: list[str] = []
+    used = 0
+    for sentence, count in zip(sentences, counts):
+        if used + count > max_tokens:
+            break
+        kept.append(sentence)
+        used += count
+    if not kept:
+        # A single sentence is over budget, so cut it mid-sentence.
+        return tokenizer.truncate_tokens(sentences[0], max_tokens, model)
+    return " ".join(kept)
+
+
+def fit_to_budget(
+    sources: list[dict[str, Any]],
+    budget: int,
+    max_tokens_per_source: int,
+    include_raw_content: bool,
+    model: str = tokenizer.DEFAULT_MODEL,
+    min_tokens_per_source: int = 32,
+) -> list[dict[str, Any]]:
+    """Trim sources so their content fits within one global token budget.
+
+    Each source's content, followed by its raw content when included, gets
+    a share of the budget weighted by its relevance score, capped at
+    max_tokens_per_source. Sources whose share is below
+    min_tokens_per_source are dropped.
+    """
+    texts = [source.get("content") or "" for source in sources]
+    raw_texts = [
+        (source.get("raw_content") or "") if include_raw_content else ""
+        for source in sources
+    ]
+    counts = tokenizer.count_tokens_batch(texts + raw_texts, model)
+    content_tokens, raw_tokens = counts[: len(sources)], counts[len(sources) :]
+
+    demands = [
+        min(content + raw, max_tokens_per_source)
+        for content, raw in zip(content_tokens, raw_tokens)
+    ]
+    weights = [float(source.get("score") or 0.0) for source in sources]
+
+    # Drop the least relevant source until every remaining source gets a
+    # useful share of the budget.
+    kept = list(range(len(sources)))
+    while True:
+        shares = allocate_budget(
+            [demands[i] for i in kept], [weights[i] for i in kept], budget
+        )
+        allocations = dict(zip(kept, shares))
+        starved = [
+            i for i in kept if allocations[i] < min(min_tokens_per_source, demands[i])
+        ]
+        if not starved:
+            break
+        kept.remove(min(starved, key=lambda i: weights[i]))
+
+    fitted = []
+    for i in kept:
+        source, allocation = sources[i], allocations[i]
+        text, raw_text, content = texts[i], raw_texts[i], content_tokens[i]
+        fitted_source = dict(source)
+        fitted_source["content"] = truncate_sentences(text, allocation, model)
+        if include_raw_content:
+            fitted_source["raw_content"] = truncate_sentences(
+                raw_text, allocation - min(content, allocation), model
+            )
+        fitted.append(fitted_source)
+    return fitted
+
+
+def compact(
+    found: list[Source],
+    focus: str,
+    max_tokens: int,
+    max_tokens_per_source: int,
+    model: str = tokenizer.DEFAULT_MODEL,
+) -> SearchResults:
+    """Distill sources gathered across many searches into one brief.
+
+    Duplicates are dropped, the rest are ranked by BM25 relevance to the
+    focus and fitted into max_tokens.
+    """
+    unique = deduplicate(asdict(source) for source in found)
+    ranked = rerank(unique, focus, len(unique))
+    # Weight the budget by rank, since scores from separate searches differ.
+    for rank, source in enumerate(ranked):
+        source["score"] = 1 / (rank + 1)
+    include_raw_content = any(source["raw_content"] is not None for source in ranked)
+    fitted = fit_to_budget(
+        ranked,
+        budget=max_tokens,
+        max_tokens_per_source=max_tokens_per_source,
+        include_raw_content=include_raw_content,
+        model=model,
+    )
+    return SearchResults(
+        sources=[Source.from_result(source, include_raw_content) for source in fitted],
+        max_tokens_per_source=max_tokens_per_source,
+    )
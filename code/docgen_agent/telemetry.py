@@ -0,0 +1,276 @@
+"""Timing and token accounting for the report generation workflow."""
+
+import asyncio
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Iterator, TypeVar
+
+from langchain_core.callbacks import AsyncCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from .ratelimit import current_job
+
+_LOGGER = logging.getLogger(__name__)
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+TRACE_PATH = os.getenv("DOCGEN_TRACE_PATH", "docgen_trace.json")
+
+# Prices per million tokens, as JSON mapping a model to [input, output].
+# Models without a price are reported at zero cost.
+MODEL_PRICES: dict[str, tuple[float, float]] = {
+    model: (float(prices[0]), float(prices[1]))
+    for model, prices in json.loads(os.getenv("DOCGEN_MODEL_PRICES", "{}")).items()
+}
+
+# The workflow node the running task is executing, for attributing LLM usage.
+_current_node: contextvars.ContextVar[str | None] = contextvars.ContextVar(
+    "current_node", default=None
+)
+
+
+@dataclass
+class SpanStats:
+    """Totals for every span recorded under one name."""
+
+    calls: int = 0
+    seconds: float = 0.0
+    max_seconds: float = 0.0
+    errors: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost: float = 0.0
+    retries: int = 0
+
+    @property
+    def mean_seconds(self) -> float:
+        return self.seconds / self.calls if self.calls else 0.0
+
+
+class Tracer:
+    """Records timed spans as Chrome trace events and per-name totals.
+
+    Spans are keyed by the job they ran for and the asyncio task that ran
+    them, which become the process and thread of each trace event. Only the
+    most recent max_events events are kept, but the totals cover every span.
+    """
+
+    def __init__(self, max_events: int = 100_000) -> None:
+        self.stats: dict[str, SpanStats] = {}
+        self._events: deque[dict[str, Any]] = deque(maxlen=max_events)
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._pids: dict[str, int] = {}
+        self._tids: dict[int, int] = {}
+
+    @contextlib.contextmanager
+    def span(self, name: str, category: str, **args: Any) -> Iterator[None]:
+        """Time the enclosed block as a span called name."""
+        start = time.perf_counter()
+        error: BaseException | None = None
+        try:
+            yield
+        except BaseException as err:
+            error = err
+            raise
+        finally:
+            end = time.perf_counter()
+            if error is not None:
+                args["error"] = type(error).__name__
+            self.record(name, category, start, end, args)
+
+    def traced(self, func: F) -> F:
+        """Decorate an async workflow node to record a span for each call."""
+        name = f"{func.__module__.rsplit('.', 1)[-1]}.{func.__name__}"
+
+        @functools.wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            token = _current_node.set(name)
+            try:
+                with self.span(name, "node"):
+                    return await func(*args, **kwargs)
+            finally:
+                _current_node.reset(token)
+
+        return wrapper  # type: ignore[return-value]
+
+    def add_usage(
+        self,
+        prompt_tokens: int,
+        completion_tokens: int,
+        cost: float = 0.0,
+        name: str | None = None,
+    ) -> None:
+        """Attribute LLM usage to name, by default the node that is running."""
+        with self._lock:
+            stats = self._stats(name or _current_node.get() or "unknown")
+            stats.prompt_tokens += prompt_tokens
+            stats.completion_tokens += completion_tokens
+            stats.cost += cost
+
+    def add_retry(self) -> None:
+        """Count a retried LLM call against the node that is running."""
+        with self._lock:
+            self._stats(_current_node.get() or "unknown").retries += 1
+
+    def reset(self) -> None:
+        with self._lock:
+            self.stats.clear()
+            self._events.clear()
+            self._pids.clear()
+            self._tids.clear()
+            self._origin = time.perf_counter()
+
+    def export_chrome_trace(self, path: str = TRACE_PATH) -> None:
+        """Write the recorded spans as a Chrome trace JSON file.
+
+        Open it in chrome://tracing or https://ui.perfetto.dev.
+        """
+        with self._lock:
+            events = [
+                {"name": "process_name", "ph": "M", "pid": pid, "args": {"name": job}}
+                for job, pid in self._pids.items()
+            ]
+            events.extend(self._events)
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as trace:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, trace)
+        _LOGGER.info("Wrote %d trace events to %s", len(events), path)
+
+    def summary(self) -> str:
+        """Format the totals for every span name as a table."""
+        with self._lock:
+            rows = sorted(self.stats.items(), key=lambda item: -item[1].seconds)
+        header = (
+            f"{'span':<36} {'calls':>6} {'total s':>9} {'mean s':>8} {'max s':>8} "
+            f"{'prompt tok':>11} {'compl tok':>10} {'cost':>8} {'retries':>8} "
+            f"{'errors':>7}"
+        )
+        lines = [header, "-" * len(header)]
+        for name, stats in rows:
+            lines.append(
+                f"{name:<36} {stats.calls:>6} {stats.seconds:>9.2f} "
+                f"{stats.mean_seconds:>8.2f} {stats.max_seconds:>8.2f} "
+                f"{stats.prompt_tokens:>11} {stats.completion_tokens:>10} "
+                f"{stats.cost:>8.4f} {stats.retries:>8} {stats.errors:>7}"
+            )
+        return "\n".join(lines)
+
+    def as_dict(self) -> dict[str, dict[str, Any]]:
+        with self._lock:
+            return {name: asdict(stats) for name, stats in self.stats.items()}
+
+    def _stats(self, name: str) -> SpanStats:
+        if name not in self.stats:
+            self.stats[name] = SpanStats()
+        return self.stats[name]
+
+    def record(
+        self,
+        name: str,
+        category: str,
+        start: float,
+        end: float,
+        args: dict[str, Any],
+    ) -> None:
+        """Record a span that ran from start to end, in perf_counter time."""
+        seconds = end - start
+        job = str(current_job.get() or "docgen")
+        try:
+            task = id(asyncio.current_task())
+        except RuntimeError:
+            task = threading.get_ident()
+        with self._lock:
+            stats = self._stats(name)
+            stats.calls += 1
+            stats.seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+            stats.errors += "error" in args
+            self._events.append(
+                {
+                    "name": name,
+                    "cat": category,
+                    "ph": "X",
+                    "ts": (start - self._origin) * 1e6,
+                    "dur": seconds * 1e6,
+                    "pid": self._pids.setdefault(job, len(self._pids)),
+                    "tid": self._tids.setdefault(task, len(self._tids)),
+                    "args": args,
+                }
+            )
+
+
+class UsageCallbackHandler(AsyncCallbackHandler):
+    """Feeds the latency and token usage of each LLM call to a tracer.
+
+    Usage is attributed to the node making the call, and each call is also
+    recorded as a span for its model route, taken from the docgen_route
+    metadata or else the model name.
+    """
+
+    def __init__(self, tracer: Tracer) -> None:
+        self.tracer = tracer
+        self._started: dict[uuid.UUID, tuple[str, str, float]] = {}
+
+    async def on_chat_model_start(
+        self,
+        serialized: dict[str, Any],
+        messages: list[list[Any]],
+        *,
+        run_id: uuid.UUID,
+        metadata: dict[str, Any] | None = None,
+        **kwargs: Any,
+    ) -> None:
+        metadata = metadata or {}
+        model = str(metadata.get("ls_model_name", "unknown"))
+        route = str(metadata.get("docgen_route", model))
+        self._started[run_id] = (f"route {route}", model, time.perf_counter())
+
+    async def on_llm_error(
+        self, error: BaseException, *, run_id: uuid.UUID, **kwargs: Any
+    ) -> None:
+        if run_id in self._started:
+            route, _, start = self._started.pop(run_id)
+            args = {"error": type(error).__name__}
+            self.tracer.record(route, "route", start, time.perf_counter(), args)
+
+    async def on_llm_end(
+        self, response: LLMResult, *, run_id: uuid.UUID, **kwargs: Any
+    ) -> None:
+        prompt_tokens = completion_tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = getattr(message, "usage_metadata", None)
+                if usage:
+                    prompt_tokens += usage.get("input_tokens", 0)
+                    completion_tokens += usage.get("output_tokens", 0)
+        if not prompt_tokens and not completion_tokens:
+            usage = (response.llm_output or {}).get("token_usage") or {}
+            prompt_tokens = usage.get("prompt_tokens", 0)
+            completion_tokens = usage.get("completion_tokens", 0)
+        self.tracer.add_usage(prompt_tokens, completion_tokens)
+
+        if run_id in self._started:
+            route, model, start = self._started.pop(run_id)
+            input_price, output_price = MODEL_PRICES.get(model, (0.0, 0.0))
+            cost = prompt_tokens * input_price + completion_tokens * output_price
+            self.tracer.record(route, "route", start, time.perf_counter(), {})
+            self.tracer.add_usage(
+                prompt_tokens, completion_tokens, cost / 1e6, name=route
+            )
+
+
+tracer = Tracer()
+usage_handler = UsageCallbackHandler(tracer)
+traced = tracer.traced
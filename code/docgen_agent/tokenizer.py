@@ -0,0 +1,103 @@
+"""Token counting for the NIM models used by the report generation workflow."""
+
+import asyncio
+import logging
+import math
+import os
+import threading
+from typing import Any
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "meta/llama-3.3-70b-instruct"
+
+# Hugging Face tokenizers matching each NIM model. Override the tokenizer for
+# every model with DOCGEN_TOKENIZER, a Hub repository or a tokenizer.json
+# file. With HF_HUB_OFFLINE=1 only tokenizers already downloaded are used.
+_TOKENIZERS = {
+    "meta/llama-3.3-70b-instruct": "unsloth/Llama-3.3-70B-Instruct",
+    "meta/llama-3.1-70b-instruct": "unsloth/Meta-Llama-3.1-70B-Instruct",
+    "meta/llama-3.1-8b-instruct": "unsloth/Meta-Llama-3.1-8B-Instruct",
+}
+_CHARS_PER_TOKEN = 4
+HF_HUB_OFFLINE = os.getenv("HF_HUB_OFFLINE", "0").lower() in ("1", "true", "yes")
+
+_tokenizers: dict[str, Any | None] = {}
+_lock = threading.Lock()
+# Set by estimate_only(), for runs whose prompts must not depend on which
+# tokenizers the machine can load.
+_estimate_only = False
+
+
+def _load_tokenizer(model: str) -> Any | None:
+    """Return the tokenizer for a model, or None to fall back to estimates.
+
+    The first call for a model may download its tokenizer, so code on the
+    event loop should await load() first.
+    """
+    if _estimate_only:
+        return None
+    with _lock:
+        if model not in _tokenizers:
+            _tokenizers[model] = _fetch_tokenizer(model)
+        return _tokenizers[model]
+
+
+def _fetch_tokenizer(model: str) -> Any | None:
+    name = os.getenv("DOCGEN_TOKENIZER") or _TOKENIZERS.get(model)
+    if not name:
+        _LOGGER.warning("No tokenizer known for %s, estimating token counts.", model)
+        return None
+    try:
+        from huggingface_hub import hf_hub_download
+        from tokenizers import Tokenizer
+
+        if os.path.isfile(name):
+            return Tokenizer.from_file(name)
+        path = hf_hub_download(name, "tokenizer.json", local_files_only=HF_HUB_OFFLINE)
+        return Tokenizer.from_file(path)
+    except Exception as err:  # missing package, offline, no network or gated model
+        _LOGGER.warning("Could not load tokenizer %s, estimating tokens: %s", name, err)
+        return None
+
+
+async def load(model: str = DEFAULT_MODEL) -> None:
+    """Load the tokenizer for a model without blocking the event loop."""
+    if not _estimate_only and model not in _tokenizers:
+        await asyncio.to_thread(_load_tokenizer, model)
+
+
+def estimate_only() -> None:
+    """Estimate every token count from now on, and never load a tokenizer."""
+    global _estimate_only
+    _estimate_only = True
+
+
+def count_tokens(text: str, model: str = DEFAULT_MODEL) -> int:
+    """Count the tokens in text for a model."""
+    tokenizer = _load_tokenizer(model)
+    if tokenizer is None:
+        return math.ceil(len(text) / _CHARS_PER_TOKEN)
+    return len(tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+def count_tokens_batch(texts: list[str], model: str = DEFAULT_MODEL) -> list[int]:
+    """Count the tokens in each of several texts for a model."""
+    tokenizer = _load_tokenizer(model)
+    if tokenizer is None:
+        return [math.ceil(len(text) / _CHARS_PER_TOKEN) for text in texts]
+    encodings = tokenizer.encode_batch(texts, add_special_tokens=False)
+    return [len(encoding.ids) for encoding in encodings]
+
+
+def truncate_tokens(text: str, max_tokens: int, model: str = DEFAULT_MODEL) -> str:
+    """Cut text down to at most max_tokens tokens for a model."""
+    if max_tokens <= 0:
+        return ""
+    tokenizer = _load_tokenizer(model)
+    if tokenizer is None:
+        return text[: max_tokens * _CHARS_PER_TOKEN]
+    encoding = tokenizer.encode(text, add_special_tokens=False)
+    if len(encoding.ids) <= max_tokens:
+        return text
+    return text[: encoding.offsets[max_tokens - 1][1]]
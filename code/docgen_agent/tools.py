@@ -1,87 +1,342 @@
 """Tools for the report generation workflow."""
 
 import asyncio
+import dataclasses
 import logging
+import math
 import os
-from typing import Literal
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Annotated, Literal
 
-from langchain_core.tools import tool
-from tavily import AsyncTavilyClient
+from langchain_core.tools import InjectedToolArg, tool
+
+from . import cassette, models, pool, sources, tokenizer
+from .backends import LocalCorpusBackend, SearchBackend, TavilySearchBackend
+from .cache import DEFAULT_CACHE_DIR, SearchCache, SqliteCache
+from .ratelimit import AdaptiveRateLimiter
+from .retry import retry_after
+from .telemetry import tracer
 
 _LOGGER = logging.getLogger(__name__)
 
-tavily_client = AsyncTavilyClient(api_key=os.getenv("TAVILY_API_KEY"))
 INCLUDE_RAW_CONTENT = False
 MAX_TOKENS_PER_SOURCE = 1000
+MAX_TOKENS_PER_SEARCH = 6000
 MAX_RESULTS = 5
+RERANK_TOP_K = 8
 SEARCH_DAYS = 30
 
+# Searches go to Tavily by default. Set DOCGEN_SEARCH_BACKEND=local to search
+# an offline index of the documents in DOCGEN_SEARCH_CORPUS instead.
+SEARCH_BACKEND = os.getenv("DOCGEN_SEARCH_BACKEND", "tavily")
+_REMOTE = SEARCH_BACKEND != "local"
+SEARCH_CORPUS_DIR = os.getenv(
+    "DOCGEN_SEARCH_CORPUS",
+    os.path.join(os.path.dirname(__file__), "..", "..", "data"),
+)
+SEARCH_CORPUS_INDEX = os.path.join(DEFAULT_CACHE_DIR, "corpus.sqlite")
+
+if cassette.active is not None and cassette.active.mode == "replay":
+    search_backend: SearchBackend = cassette.CassetteSearchBackend(
+        cassette.active, None
+    )
+elif _REMOTE:
+    search_backend = TavilySearchBackend(api_key=os.getenv("TAVILY_API_KEY"))
+else:
+    search_backend = LocalCorpusBackend(SEARCH_CORPUS_DIR, SEARCH_CORPUS_INDEX)
+if cassette.active is not None and cassette.active.mode == "record":
+    search_backend = cassette.CassetteSearchBackend(cassette.active, search_backend)
+
+# Tavily results are cached on disk so repeat reports skip the network.
+# Set TAVILY_CACHE_PATH to an empty string to disable the cache.
+SEARCH_CACHE_PATH = (
+    os.getenv("TAVILY_CACHE_PATH", os.path.join(DEFAULT_CACHE_DIR, "tavily.sqlite"))
+    if _REMOTE
+    else ""
+)
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("TAVILY_CACHE_MAX_ENTRIES", "10000"))
+SEARCH_CACHE_TTLS = {
+    "news": 6 * 60 * 60,
+    "finance": 60 * 60,
+    "general": 7 * 24 * 60 * 60,
+}
+
+# All Tavily requests, from every researcher and author, share one limiter.
+# The local backend has no rate limits, so it is effectively unthrottled.
+SEARCH_MAX_RATE = float(os.getenv("TAVILY_MAX_RATE", "5" if _REMOTE else "10000"))
+SEARCH_MAX_CONCURRENCY = int(
+    os.getenv("TAVILY_MAX_CONCURRENCY", "8" if _REMOTE else "64")
+)
+SEARCH_MAX_RETRIES = 5
+
+# A search that has not answered within the deadline of being sent is given
+# up, and search_tavily returns the results of the rest. Time spent waiting
+# for the rate limiter does not count. With hedging enabled, a search slower than the recent p95 latency is sent again
+# and the first response wins.
+SEARCH_DEADLINE = float(os.getenv("TAVILY_DEADLINE", "30"))
+SEARCH_HEDGE = os.getenv("TAVILY_HEDGE", "0") == "1" and cassette.active is None
+
+# Searches are answered from the report's research pool when it covers them.
+# What the pool holds depends on which sections searched first, so set
+# DOCGEN_RESEARCH_POOL=0 for runs that must repeat the same prompts, such as
+# iterating on later stages with the LLM cache. Hedging and the pool both
+# depend on timing, so neither is used while a cassette is recorded or replayed.
+RESEARCH_POOL = (
+    os.getenv("DOCGEN_RESEARCH_POOL", "1") == "1" and cassette.active is None
+)
+
+search_limiter = AdaptiveRateLimiter(
+    max_rate=SEARCH_MAX_RATE, max_concurrency=SEARCH_MAX_CONCURRENCY
+)
+
+# Every search has to reach a cassette, so the cache is off while one is used.
+search_cache: SearchCache | None = (
+    SqliteCache(SEARCH_CACHE_PATH, max_entries=SEARCH_CACHE_MAX_ENTRIES)
+    if SEARCH_CACHE_PATH and cassette.active is None
+    else None
+)
+
+
+@dataclass
+class SearchStats:
+    """Counters for search requests made through search_tavily."""
+
+    requests: int = 0
+    # queries requested by the agents
+    cache_hits: int = 0
+    # queries answered by the search cache
+    coalesced: int = 0
+    # queries that joined an identical search already in flight
+    pooled: int = 0
+    # queries answered from the report's research pool
+    fetched: int = 0
+    # queries that were sent to the search backend
+    hedged: int = 0
+    # duplicate requests sent for slow queries
+    timed_out: int = 0
+    # searches given up because the backend missed the deadline
+
+    @property
+    def saved(self) -> int:
+        return self.cache_hits + self.coalesced + self.pooled
+
+    def copy(self) -> "SearchStats":
+        return dataclasses.replace(self)
+
+    def __sub__(self, other: "SearchStats") -> "SearchStats":
+        return SearchStats(
+            *(
+                getattr(self, field.name) - getattr(other, field.name)
+                for field in dataclasses.fields(self)
+            )
+        )
+
+
+search_stats = SearchStats()
+
+
+class LatencyTracker:
+    """Tracks recent request latencies to estimate percentiles."""
+
+    def __init__(self, window: int = 200, min_samples: int = 20) -> None:
+        self.min_samples = min_samples
+        self._samples: deque[float] = deque(maxlen=window)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, pct: float) -> float | None:
+        """Return the pct percentile latency, or None without enough samples."""
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, math.ceil(pct * len(ordered)) - 1)]
 
-def _deduplicate_and_format_sources(
-    search_response, max_tokens_per_source, include_raw_content=True
-):
+
+search_latency = LatencyTracker()
+
+# Searches currently waiting on the network, keyed like the search cache.
+# Identical concurrent queries await the same task instead of refetching.
+_in_flight: dict[tuple, asyncio.Task] = {}
+
+
+def _normalize_query(query: str) -> str:
+    """Normalize a query so trivially different spellings share a search."""
+    return " ".join(query.lower().split())
+
+
+def _select_sources(
+    unique_sources, max_tokens_per_source, include_raw_content, max_tokens, focus=None
+) -> sources.SearchResults:
+    """Fit already deduplicated sources into the token budget.
+
+    When a focus is given, only the RERANK_TOP_K sources most relevant to it
+    are kept.
     """
-    Takes either a single search response or list of responses from Tavily API and formats them.
-    Limits the raw_content to approximately max_tokens_per_source.
-    include_raw_content specifies whether to include the raw_content from Tavily in the formatted string.
+    if focus:
+        unique_sources = sources.rerank(unique_sources, focus, RERANK_TOP_K)
 
-    Args:
-        search_response: Either:
-            - A dict with a 'results' key containing a list of search results
-            - A list of dicts, each containing search results
+    if include_raw_content:
+        for source in unique_sources:
+            if source.get("raw_content") is None:
+                print(f"Warning: No raw_content found for source {source['url']}")
 
-    Returns:
-        str: Formatted string with deduplicated sources
+    # Fit the content of every source into one token budget
+    budgeted_sources = sources.fit_to_budget(
+        unique_sources,
+        budget=max_tokens,
+        max_tokens_per_source=max_tokens_per_source,
+        include_raw_content=include_raw_content,
+        model=models.primary_model("writer"),
+    )
+
+    return sources.SearchResults(
+        sources=[
+            sources.Source.from_result(source, include_raw_content)
+            for source in budgeted_sources
+        ],
+        max_tokens_per_source=max_tokens_per_source,
+    )
+
+
+async def _research(
+    query: str, topic: str, days: int | None, research_pool: pool.ResearchPool | None
+) -> dict:
+    """Answer a query from the research pool, or search for it and pool the results."""
+    if research_pool is not None:
+        recalled = research_pool.search(query, MAX_RESULTS)
+        if recalled is not None:
+            search_stats.requests += 1
+            search_stats.pooled += 1
+            return recalled
+
+    response = await _search(query, topic, days)
+    if research_pool is not None:
+        research_pool.add(response["results"])
+    return response
+
+
+async def _search(query: str, topic: str, days: int | None) -> dict:
+    """Run a single search.
+
+    Results are served from the search cache when possible, and concurrent
+    requests for the same normalized query share a single API call.
     """
-    # Convert input to list of results
-    if isinstance(search_response, dict):
-        sources_list = search_response["results"]
-    elif isinstance(search_response, list):
-        sources_list = []
-        for response in search_response:
-            if isinstance(response, dict) and "results" in response:
-                sources_list.extend(response["results"])
-            else:
-                sources_list.extend(response)
+    query = _normalize_query(query)
+    key = (query, topic, days, MAX_RESULTS, INCLUDE_RAW_CONTENT)
+    search_stats.requests += 1
+
+    if search_cache is not None:
+        cached = search_cache.get(key)
+        if cached is not None:
+            _LOGGER.info("Cache hit for query: %s", query)
+            search_stats.cache_hits += 1
+            return cached
+
+    task = _in_flight.get(key)
+    if task is not None and task.get_loop() is asyncio.get_running_loop():
+        _LOGGER.info("Joining in-flight search for query: %s", query)
+        search_stats.coalesced += 1
     else:
-        raise ValueError(
-            "Input must be either a dict with 'results' or a list of search results"
+        task = asyncio.create_task(_fetch(key))
+        _in_flight[key] = task
+        task.add_done_callback(
+            lambda done: _in_flight.pop(key) if _in_flight.get(key) is done else None
         )
 
-    # Deduplicate by URL
-    unique_sources = {}
-    for source in sources_list:
-        if source["url"] not in unique_sources:
-            unique_sources[source["url"]] = source
-
-    # Format output
-    formatted_text = "Sources:\n\n"
-    for i, source in enumerate(unique_sources.values(), 1):
-        formatted_text += f"Source {source['title']}:\n===\n"
-        formatted_text += f"URL: {source['url']}\n===\n"
-        formatted_text += (
-            f"Most relevant content from source: {source['content']}\n===\n"
-        )
-        if include_raw_content:
-            # Using rough estimate of 4 characters per token
-            char_limit = max_tokens_per_source * 4
-            # Handle None raw_content
-            raw_content = source.get("raw_content", "")
-            if raw_content is None:
-                raw_content = ""
-                print(f"Warning: No raw_content found for source {source['url']}")
-            if len(raw_content) > char_limit:
-                raw_content = raw_content[:char_limit] + "... [truncated]"
-            formatted_text += f"Full source content limited to {max_tokens_per_source} tokens: {raw_content}\n\n"
+    # Shield the shared task so one cancelled caller does not cancel the rest.
+    return await asyncio.shield(task)
+
 
-    return formatted_text.strip()
+async def _fetch(key: tuple) -> dict:
+    """Send a search to the search backend and cache the response."""
+    query, topic, days, max_results, include_raw_content = key
+    _LOGGER.info("Searching for query: %s", query)
+    search_stats.fetched += 1
+    for count in range(SEARCH_MAX_RETRIES):
+        async with search_limiter:
+            try:
+                with tracer.span("search", "search", query=query, topic=topic):
+                    response = await asyncio.wait_for(
+                        _hedged_search(
+                            query,
+                            max_results=max_results,
+                            include_raw_content=include_raw_content,
+                            topic=topic,
+                            days=days,
+                        ),
+                        SEARCH_DEADLINE,
+                    )
+            except TimeoutError:
+                _LOGGER.warning(
+                    "Search deadline of %.1fs exceeded for query: %s",
+                    SEARCH_DEADLINE,
+                    query,
+                )
+                search_stats.timed_out += 1
+                raise
+            except Exception as err:
+                if not _is_rate_limited(err) or count + 1 == SEARCH_MAX_RETRIES:
+                    raise
+                search_limiter.on_rate_limited(retry_after(err))
+                _LOGGER.debug(
+                    "Retrying search. Attempt %d of %d", count + 1, SEARCH_MAX_RETRIES
+                )
+                continue
+        search_limiter.on_success()
+        break
+    if search_cache is not None:
+        search_cache.set(key, response, ttl=SEARCH_CACHE_TTLS.get(topic, 0))
+    return response
+
+
+async def _hedged_search(query: str, **kwargs) -> dict:
+    """Call the search backend, hedging slow requests when SEARCH_HEDGE is set."""
+    start = time.monotonic()
+    hedge_after = search_latency.percentile(0.95) if SEARCH_HEDGE else None
+    requests = [asyncio.create_task(search_backend.search(query, **kwargs))]
+    try:
+        done, _ = await asyncio.wait(requests, timeout=hedge_after)
+        if not done:
+            _LOGGER.info("Hedging slow search for query: %s", query)
+            search_stats.hedged += 1
+            requests.append(asyncio.create_task(search_backend.search(query, **kwargs)))
+
+        # Take the first successful response, and only fail if every request did.
+        error: Exception | None = None
+        for request in asyncio.as_completed(requests):
+            try:
+                response = await request
+            except Exception as err:
+                error = err
+                continue
+            search_latency.record(time.monotonic() - start)
+            return response
+        raise error  # type: ignore[misc]
+    finally:
+        for request in requests:
+            request.cancel()
+
+
+def _is_rate_limited(err: Exception) -> bool:
+    """Check if an exception was caused by an HTTP 429 response."""
+    from tavily.errors import UsageLimitExceededError
 
+    if isinstance(err, UsageLimitExceededError):
+        return True
+    response = getattr(err, "response", None)
+    return getattr(response, "status_code", None) == 429
 
-@tool(parse_docstring=True)
+
+@tool(parse_docstring=True, response_format="content_and_artifact")
 async def search_tavily(
     queries: list[str],
     topic: Literal["general", "news", "finance"] = "news",
-) -> str:
+    focus: Annotated[str | None, InjectedToolArg] = None,
+    report_id: Annotated[str | None, InjectedToolArg] = None,
+) -> tuple[str, sources.SearchResults]:
     """Search the web using the Tavily API.
 
     Args:
@@ -90,9 +345,11 @@ async def search_tavily(
           general - General search.
           news - News search.
           finance - Finance search.
+        focus: What the research is for, used to rerank the results.
+        report_id: The report whose research pool to search and add to.
 
     Returns:
-        A string of the search results.
+        The search results rendered for the prompt, and the structured results.
     """
     _LOGGER.info("Searching the web using the Tavily API")
 
@@ -100,27 +357,51 @@ async def search_tavily(
     if topic == "news":
         days = SEARCH_DAYS
 
-    search_jobs = []
-    for query in queries:
-        _LOGGER.info("Searching for query: %s", query)
-        search_jobs.append(
-            asyncio.create_task(
-                tavily_client.search(
-                    query,
-                    max_results=MAX_RESULTS,
-                    include_raw_content=INCLUDE_RAW_CONTENT,
-                    topic=topic,
-                    days=days,  # type: ignore[arg-type]
-                )
-            )
-        )
+    research_pool = pool.get_pool(report_id) if report_id and RESEARCH_POOL else None
+    # Each search is held to the deadline by _fetch. Responses are
+    # deduplicated in query order, not arrival order, so the same searches
+    # always give the same results whatever the network timing.
+    responses = await asyncio.gather(
+        *(_research(query, topic, days, research_pool) for query in queries),
+        return_exceptions=True,
+    )
 
-    search_docs = await asyncio.gather(*search_jobs)
+    deduplicator = sources.Deduplicator()
+    unique_sources = []
+    completed = 0
+    errors: list[Exception] = []
+    for response in responses:
+        if isinstance(response, cassette.CassetteMissError):
+            raise response
+        if isinstance(response, TimeoutError):
+            continue
+        if isinstance(response, Exception):
+            _LOGGER.warning("Search failed: %s", response)
+            errors.append(response)
+            continue
+        if isinstance(response, BaseException):
+            raise response
+        completed += 1
+        unique_sources.extend(deduplicator.filter(response["results"]))
 
-    formatted_search_docs = _deduplicate_and_format_sources(
-        search_docs,
+    if errors and not completed:
+        raise errors[0]
+
+    # Fitting the results to the budget counts tokens, and the first count
+    # may download the tokenizer.
+    await tokenizer.load(models.primary_model("writer"))
+    search_results = _select_sources(
+        unique_sources,
         max_tokens_per_source=MAX_TOKENS_PER_SOURCE,
         include_raw_content=INCLUDE_RAW_CONTENT,
+        max_tokens=MAX_TOKENS_PER_SEARCH,
+        focus=focus,
     )
+    if completed < len(queries):
+        search_results.note = (
+            f"Note: these results are partial. Only {completed} of "
+            f"{len(queries)} searches completed."
+        )
+    formatted_search_docs = search_results.render()
     _LOGGER.debug("Search results: %s", formatted_search_docs)
-    return formatted_search_docs
+    return formatted_search_docs, search_results
@@ -0,0 +1,224 @@
+"""Keep-alive HTTP connection pools shared by every NIM client.
+
+ChatNVIDIA opens a new session for each call by default, so every call
+pays for a new TCP connection and TLS handshake. Async calls, which are
+all the calls the workflow makes, go through aiohttp, and sync calls go
+through requests. attach() points a client at process-wide pools for both
+instead, which keep connections open and reuse them across calls and
+models.
+
+The pools are set with environment variables:
+
+    DOCGEN_HTTP_POOL_SIZE   connections kept open per host, by default
+                            LLM_MAX_CONCURRENCY
+    DOCGEN_HTTP_POOL_HOSTS  hosts to keep a pool for, by default 4
+    DOCGEN_HTTP_POOL_BLOCK  set to 1 to make calls wait for a free pooled
+                            connection instead of opening an extra one
+"""
+
+import asyncio
+import atexit
+import contextlib
+import functools
+import logging
+import os
+import ssl
+from dataclasses import asdict, dataclass
+from typing import TYPE_CHECKING, Any, AsyncIterator
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .ratelimit import LLM_MAX_CONCURRENCY
+
+if TYPE_CHECKING:
+    import aiohttp
+
+_LOGGER = logging.getLogger(__name__)
+
+HTTP_POOL_SIZE = int(os.getenv("DOCGEN_HTTP_POOL_SIZE", str(LLM_MAX_CONCURRENCY)))
+HTTP_POOL_HOSTS = int(os.getenv("DOCGEN_HTTP_POOL_HOSTS", "4"))
+HTTP_POOL_BLOCK = os.getenv("DOCGEN_HTTP_POOL_BLOCK", "0") == "1"
+
+# The verify_ssl setting of a client: whether to verify certificates, or
+# the path of a CA bundle to verify them with.
+Verify = bool | str
+
+
+@dataclass
+class PoolStats:
+    """Counts of the requests sent and the connections opened to send them."""
+
+    requests: int = 0
+    connections: int = 0
+    idle: int = 0
+    # connections open and waiting to be reused
+
+    @property
+    def reuse_rate(self) -> float:
+        """The share of requests sent on a connection that was already open."""
+        if not self.requests:
+            return 0.0
+        return max(0.0, 1 - self.connections / self.requests)
+
+    def as_dict(self) -> dict[str, Any]:
+        return {**asdict(self), "reuse_rate": round(self.reuse_rate, 3)}
+
+
+class HTTPPool:
+    """Keep-alive connection pools per host, for requests and for aiohttp.
+
+    Clients with different verify_ssl settings get separate pools, so each
+    keeps its own certificate checks. The aiohttp pool is bound to an event
+    loop, so each loop gets its own, and it stays open while any use() block
+    on that loop is running. Both send HTTP/1.1 only, so connections are
+    reused rather than multiplexed.
+    """
+
+    def __init__(self, size: int, hosts: int, block: bool = False) -> None:
+        self.size = size
+        self.hosts = hosts
+        self.block = block
+        self._sessions: dict[Verify, requests.Session] = {}
+        self._connectors: dict[
+            tuple[asyncio.AbstractEventLoop, Verify], "aiohttp.TCPConnector"
+        ] = {}
+        self._users: dict[asyncio.AbstractEventLoop, int] = {}
+        self._async_stats = PoolStats()
+
+    def session(self, verify: Verify = True) -> requests.Session:
+        """Return the shared requests session for a verify_ssl setting."""
+        session = self._sessions.get(verify)
+        if session is None:
+            session = requests.Session()
+            session.verify = verify
+            adapter = HTTPAdapter(
+                pool_connections=self.hosts,
+                pool_maxsize=self.size,
+                pool_block=self.block,
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            atexit.register(session.close)
+            self._sessions[verify] = session
+        return session
+
+    def async_session(self, verify: Verify = True) -> "aiohttp.ClientSession":
+        """Return an aiohttp session on the shared pool for the running loop.
+
+        ChatNVIDIA closes its session after every call. The session does not
+        own the pool, so closing it leaves the pooled connections open.
+        """
+        import aiohttp
+
+        return aiohttp.ClientSession(
+            connector=self._connector(verify),
+            connector_owner=False,
+            trace_configs=[self._trace_config],
+        )
+
+    @contextlib.asynccontextmanager
+    async def use(self) -> AsyncIterator["HTTPPool"]:
+        """Use the running loop's aiohttp pools, closing them after the last user.
+
+        Reports written concurrently on one loop share its pools, so a
+        report that finishes first must not close them under the others.
+        """
+        loop = asyncio.get_running_loop()
+        self._users[loop] = self._users.get(loop, 0) + 1
+        try:
+            yield self
+        finally:
+            self._users[loop] -= 1
+            if not self._users[loop]:
+                del self._users[loop]
+                await self.aclose()
+
+    async def aclose(self) -> None:
+        """Close the aiohttp pools of the running event loop."""
+        loop = asyncio.get_running_loop()
+        for key in [key for key in self._connectors if key[0] is loop]:
+            await self._connectors.pop(key).close()
+
+    def attach(self, model: Any) -> Any:
+        """Send a ChatNVIDIA client's requests through the shared pools."""
+        client = getattr(model, "_client", None)
+        if client is None or not hasattr(client, "get_async_session_fn"):
+            _LOGGER.warning(
+                "Cannot share the HTTP pool with %s, it has no session factory.",
+                type(model).__name__,
+            )
+            return model
+        verify = getattr(client, "verify_ssl", True)
+        client.get_session_fn = lambda: self.session(verify)
+        client.get_async_session_fn = lambda: self.async_session(verify)
+        return model
+
+    @property
+    def stats(self) -> PoolStats:
+        stats = PoolStats(
+            requests=self._async_stats.requests,
+            connections=self._async_stats.connections,
+        )
+        for connector in self._connectors.values():
+            # aiohttp keeps the idle connections of each host in _conns.
+            idle = getattr(connector, "_conns", {})
+            stats.idle += sum(len(conns) for conns in idle.values())
+        for session in self._sessions.values():
+            for adapter in set(session.adapters.values()):
+                if not isinstance(adapter, HTTPAdapter):
+                    continue
+                pools = adapter.poolmanager.pools
+                for key in pools.keys():
+                    try:
+                        pool = pools[key]
+                    except KeyError:
+                        continue  # evicted since it was listed
+                    stats.requests += pool.num_requests
+                    stats.connections += pool.num_connections
+                    # The queue holds None for each slot without an open connection.
+                    idle = list(pool.pool.queue) if pool.pool is not None else []
+                    stats.idle += sum(conn is not None for conn in idle)
+        return stats
+
+    def _connector(self, verify: Verify) -> "aiohttp.TCPConnector":
+        import aiohttp
+
+        loop = asyncio.get_running_loop()
+        # Forget the pools of loops that have since been closed.
+        for key in [key for key in self._connectors if key[0].is_closed()]:
+            del self._connectors[key]
+        connector = self._connectors.get((loop, verify))
+        if connector is None or connector.closed:
+            connector = aiohttp.TCPConnector(
+                ssl=_ssl_context(verify),
+                limit=self.size * self.hosts if self.block else 0,
+                limit_per_host=self.size if self.block else 0,
+            )
+            self._connectors[(loop, verify)] = connector
+        return connector
+
+    @functools.cached_property
+    def _trace_config(self) -> "aiohttp.TraceConfig":
+        import aiohttp
+
+        async def on_request_start(*_: Any) -> None:
+            self._async_stats.requests += 1
+
+        async def on_connection_create_end(*_: Any) -> None:
+            self._async_stats.connections += 1
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        return trace_config
+
+
+def _ssl_context(verify: Verify) -> bool | ssl.SSLContext:
+    """Build the aiohttp ssl argument for a verify_ssl setting, as ChatNVIDIA does."""
+    if isinstance(verify, str):
+        return ssl.create_default_context(cafile=verify)
+    return verify
+
+
+http_pool = HTTPPool(size=HTTP_POOL_SIZE, hosts=HTTP_POOL_HOSTS, block=HTTP_POOL_BLOCK)
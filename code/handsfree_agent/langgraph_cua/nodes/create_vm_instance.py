@@ -1,9 +1,13 @@
+from typing import TYPE_CHECKING
+
 from langchain_core.runnables.config import RunnableConfig
-from scrapybara.client import BrowserInstance, UbuntuInstance, WindowsInstance
 
 from ..types import CUAState
 from ..utils import get_configuration_with_defaults, get_scrapybara_client
 
+if TYPE_CHECKING:
+    from scrapybara.client import BrowserInstance, UbuntuInstance, WindowsInstance
+
 # Copied from the OpenAI example repository
 # https://github.com/openai/openai-cua-sample-app/blob/eb2d58ba77ffd3206d3346d6357093647d29d99c/utils.py#L13
 BLOCKED_DOMAINS = [
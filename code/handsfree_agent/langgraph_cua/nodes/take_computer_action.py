@@ -1,15 +1,17 @@
 import time
-from typing import Any, Dict, Optional
+from typing import TYPE_CHECKING, Any, Dict, Optional
 
 from langchain_core.messages import AnyMessage, ToolMessage
 from langchain_core.runnables import RunnableConfig
 from langgraph.config import get_stream_writer
-from openai.types.responses.response_computer_tool_call import ResponseComputerToolCall
-from scrapybara.types import ComputerResponse, InstanceGetStreamUrlResponse
 
 from ..types import CUAState, get_configuration_with_defaults
 from ..utils import get_instance, is_computer_tool_call
 
+if TYPE_CHECKING:
+    from openai.types.responses.response_computer_tool_call import ResponseComputerToolCall
+    from scrapybara.types import ComputerResponse, InstanceGetStreamUrlResponse
+
 # Copied from the OpenAI example repository
 # https://github.com/openai/openai-cua-sample-app/blob/eb2d58ba77ffd3206d3346d6357093647d29d99c/computers/scrapybara.py#L10
 CUA_KEY_TO_SCRAPYBARA_KEY = {
@@ -1,15 +1,21 @@
-from typing import Any, Union
+from __future__ import annotations
+
+import functools
+from typing import TYPE_CHECKING, Any, Union
 
 from langchain_core.runnables import RunnableConfig
-from scrapybara import Scrapybara
-from scrapybara.client import BrowserInstance, UbuntuInstance, WindowsInstance
 
 from .types import get_configuration_with_defaults
 
+if TYPE_CHECKING:
+    from scrapybara import Scrapybara
+    from scrapybara.client import BrowserInstance, UbuntuInstance, WindowsInstance
+
 
 def get_scrapybara_client(api_key: str) -> Scrapybara:
     """
-    Gets the Scrapybara client, using the API key provided.
+    Gets the Scrapybara client, using the API key provided. Clients are
+    created on first use and shared across calls with the same API key.
 
     Args:
         api_key: The API key for Scrapybara.
@@ -22,8 +28,14 @@ def get_scrapybara_client(api_key: str) -> Scrapybara:
             "Scrapybara API key not provided. Please provide one in the configurable fields, "
             "or set it as an environment variable (SCRAPYBARA_API_KEY)"
         )
-    client = Scrapybara(api_key=api_key)
-    return client
+    return _scrapybara_client(api_key)
+
+
+@functools.lru_cache(maxsize=None)
+def _scrapybara_client(api_key: str) -> Scrapybara:
+    from scrapybara import Scrapybara
+
+    return Scrapybara(api_key=api_key)
 
 
 def get_instance(
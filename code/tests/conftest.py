@@ -0,0 +1,9 @@
+"""Keep the docgen_agent tests off the network and out of the user's caches."""
+
+import os
+
+# Set before docgen_agent is imported, since it reads its settings on import.
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("LLM_CACHE_PATH", "")
+os.environ.setdefault("TAVILY_CACHE_PATH", "")
+os.environ.setdefault("DOCGEN_CHECKPOINT_PATH", "")
@@ -0,0 +1,69 @@
+import pytest
+
+from docgen_agent import cache
+from docgen_agent.cache import SqliteCache
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1_000_000.0
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> FakeClock:
+    clock = FakeClock()
+    monkeypatch.setattr(cache, "time", clock)
+    return clock
+
+
+def test_entries_expire_after_their_ttl(clock: FakeClock) -> None:
+    store = SqliteCache(":memory:")
+    store.set(("query",), {"results": [1]}, ttl=60)
+
+    clock.now += 59
+    assert store.get(("query",)) == {"results": [1]}
+    clock.now += 1
+    assert store.get(("query",)) is None
+
+    assert store.stats.hits == 1
+    assert store.stats.expired == 1
+    assert len(store) == 0
+
+
+def test_zero_ttl_is_not_stored(clock: FakeClock) -> None:
+    store = SqliteCache(":memory:")
+    store.set(("query",), "value", ttl=0)
+    assert len(store) == 0
+
+
+def test_least_recently_used_entries_are_evicted(clock: FakeClock) -> None:
+    store = SqliteCache(":memory:", max_entries=2)
+    store.set(("a",), "a", ttl=60)
+    clock.now += 1
+    store.set(("b",), "b", ttl=60)
+    clock.now += 1
+    assert store.get(("a",)) == "a"
+    clock.now += 1
+
+    store.set(("c",), "c", ttl=60)
+
+    assert store.get(("b",)) is None
+    assert store.get(("a",)) == "a"
+    assert store.get(("c",)) == "c"
+    assert store.stats.evictions == 1
+
+
+def test_expired_entries_are_evicted_before_live_ones(clock: FakeClock) -> None:
+    store = SqliteCache(":memory:", max_entries=2)
+    store.set(("old",), "old", ttl=1)
+    clock.now += 1
+    store.set(("a",), "a", ttl=60)
+    clock.now += 1
+    store.set(("b",), "b", ttl=60)
+
+    assert len(store) == 2
+    assert store.get(("a",)) == "a"
+    assert store.get(("b",)) == "b"
@@ -0,0 +1,61 @@
+from langchain_core.messages import ToolMessage
+
+from docgen_agent import sources
+from docgen_agent.governor import LoopGovernor
+
+
+def _results(*urls: str) -> ToolMessage:
+    found = [sources.Source(title=url, url=url, content="x" * 100) for url in urls]
+    return ToolMessage(
+        content="", tool_call_id="call", artifact=sources.SearchResults(sources=found)
+    )
+
+
+def test_novelty_is_the_share_of_content_from_unseen_sources() -> None:
+    governor = LoopGovernor(max_rounds=3, min_novelty=0.25)
+    messages = [
+        _results("https://a.com/1", "https://a.com/2"),
+        _results("https://a.com/3"),
+    ]
+    seen = [sources.canonicalize_url("https://a.com/1")]
+
+    novelty, new_urls = governor.measure(messages, seen_urls=seen)
+
+    assert novelty == 2 / 3
+    assert new_urls == [
+        sources.canonicalize_url(url) for url in ["https://a.com/2", "https://a.com/3"]
+    ]
+    assert governor.stats.rounds == 1
+
+
+def test_first_round_always_searches() -> None:
+    governor = LoopGovernor(max_rounds=3, min_novelty=0.25)
+    assert governor.should_search(rounds=0, novelty=0.0)
+
+
+def test_stops_when_a_round_finds_too_little_that_is_new() -> None:
+    governor = LoopGovernor(max_rounds=3, min_novelty=0.25)
+
+    assert governor.should_search(rounds=1, novelty=0.25)
+    assert not governor.should_search(rounds=1, novelty=0.2)
+    assert governor.stats.stopped_low_novelty == 1
+
+
+def test_stops_once_the_round_budget_is_used_up() -> None:
+    governor = LoopGovernor(max_rounds=2, min_novelty=0.25)
+
+    assert not governor.should_search(rounds=2, novelty=1.0)
+    assert governor.stats.stopped_budget == 1
+
+
+def test_declined_tool_calls_are_answered() -> None:
+    governor = LoopGovernor(max_rounds=2, min_novelty=0.25)
+    tool_calls = [
+        {"name": "search_tavily", "args": {"queries": ["a", "b"]}, "id": "call_1"},
+        {"name": "search_tavily", "args": {"queries": ["c"]}, "id": "call_2"},
+    ]
+
+    replies = governor.decline(tool_calls)
+
+    assert [reply.tool_call_id for reply in replies] == ["call_1", "call_2"]
+    assert governor.stats.saved_searches == 3
@@ -0,0 +1,172 @@
+import asyncio
+import time
+
+import pytest
+
+from docgen_agent.ratelimit import AdaptiveRateLimiter, AIMDLimiter, current_job
+
+
+async def _hold(limiter: AIMDLimiter, release: asyncio.Event) -> None:
+    async with limiter.slot():
+        await release.wait()
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_gives_up_its_place() -> None:
+    limiter = AIMDLimiter(initial=1)
+    release = asyncio.Event()
+    holder = asyncio.create_task(_hold(limiter, release))
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(_hold(limiter, asyncio.Event()))
+    await asyncio.sleep(0)
+    assert limiter.in_flight == 1
+
+    waiter.cancel()
+    release.set()
+    await holder
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+
+    assert limiter.in_flight == 0
+    async with limiter.slot():
+        assert limiter.in_flight == 1
+
+
+@pytest.mark.asyncio
+async def test_slot_granted_to_a_cancelled_waiter_is_released() -> None:
+    limiter = AIMDLimiter(initial=1)
+    release = asyncio.Event()
+    holder = asyncio.create_task(_hold(limiter, release))
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(_hold(limiter, asyncio.Event()))
+    await asyncio.sleep(0)
+
+    # The holder hands its slot to the waiter, which is cancelled before it
+    # gets to run.
+    release.set()
+    await asyncio.sleep(0)
+    assert holder.done()
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+
+    assert limiter.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_freed_slots_wake_each_job_in_turn() -> None:
+    limiter = AIMDLimiter(initial=1)
+    release = asyncio.Event()
+    holder = asyncio.create_task(_hold(limiter, release))
+    await asyncio.sleep(0)
+
+    order = []
+
+    async def call(job: str, name: str) -> None:
+        current_job.set(job)
+        async with limiter.slot():
+            order.append(name)
+
+    calls = [
+        asyncio.create_task(call(job, name))
+        for job, name in [("a", "a0"), ("a", "a1"), ("a", "a2"), ("b", "b0")]
+    ]
+    await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(holder, *calls)
+
+    assert order == ["a0", "b0", "a1", "a2"]
+    assert limiter.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_overload_halves_the_limit_once_per_burst() -> None:
+    limiter = AIMDLimiter(initial=8)
+
+    async def fail() -> None:
+        async with limiter.slot():
+            await asyncio.sleep(0)
+            raise TimeoutError
+
+    results = await asyncio.gather(*(fail() for _ in range(4)), return_exceptions=True)
+
+    assert all(isinstance(result, TimeoutError) for result in results)
+    assert limiter.limit == 4
+    assert limiter.overloaded == 4
+
+
+@pytest.mark.asyncio
+async def test_successes_raise_the_limit_additively() -> None:
+    limiter = AIMDLimiter(initial=2, max_limit=3)
+    for _ in range(10):
+        async with limiter.slot():
+            pass
+    assert limiter.limit == 3
+
+
+def test_rate_limits_back_off_to_the_minimum_rate() -> None:
+    limiter = AdaptiveRateLimiter(max_rate=8, max_concurrency=4, min_rate=1)
+    limiter.on_rate_limited()
+    assert limiter.rate == 4
+    for _ in range(5):
+        limiter.on_rate_limited()
+    assert limiter.rate == 1
+    assert limiter.rate_limited == 6
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_pauses_requests_for_retry_after() -> None:
+    limiter = AdaptiveRateLimiter(max_rate=100, max_concurrency=4)
+    limiter.on_rate_limited(retry_after=0.2)
+
+    start = time.monotonic()
+    async with limiter:
+        pass
+
+    assert time.monotonic() - start >= 0.19
+    assert limiter.in_flight == 0
+
+
+def test_successes_ramp_the_rate_back_up() -> None:
+    limiter = AdaptiveRateLimiter(max_rate=10, max_concurrency=4, ramp_after=2)
+    limiter.on_rate_limited()
+    assert limiter.rate == 5
+
+    limiter.on_success()
+    assert limiter.rate == 5
+    limiter.on_success()
+    assert limiter.rate == 6
+    for _ in range(20):
+        limiter.on_success()
+    assert limiter.rate == 10
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_lets_each_job_through_in_turn() -> None:
+    limiter = AdaptiveRateLimiter(max_rate=1000, max_concurrency=1)
+    release = asyncio.Event()
+
+    async def hold() -> None:
+        async with limiter:
+            await release.wait()
+
+    holder = asyncio.create_task(hold())
+    await asyncio.sleep(0)
+
+    order = []
+
+    async def call(job: str, name: str) -> None:
+        current_job.set(job)
+        async with limiter:
+            order.append(name)
+
+    calls = [
+        asyncio.create_task(call(job, name))
+        for job, name in [("a", "a0"), ("a", "a1"), ("b", "b0"), ("a", "a2")]
+    ]
+    await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(holder, *calls)
+
+    assert order == ["a0", "b0", "a1", "a2"]
+    assert limiter.in_flight == 0
@@ -0,0 +1,85 @@
+import pytest
+
+from docgen_agent import sources, tokenizer
+
+
+@pytest.fixture(autouse=True)
+def estimated_tokens(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Count tokens with the estimate of one per four characters."""
+    monkeypatch.setattr(tokenizer, "_load_tokenizer", lambda model: None)
+
+
+def test_budget_is_split_by_weight() -> None:
+    assert sources.allocate_budget([100, 100], [3.0, 1.0], 80) == [60, 20]
+
+
+def test_no_source_gets_more_than_it_demands() -> None:
+    allocations = sources.allocate_budget([10, 100, 100], [1.0, 1.0, 1.0], 90)
+    # The first source only needs 10, and the rest is shared by the others.
+    assert allocations == [10, 40, 40]
+
+
+def test_budget_covering_every_demand_satisfies_them_all() -> None:
+    assert sources.allocate_budget([10, 0, 30], [0.1, 0.9, 0.5], 1000) == [10, 0, 30]
+
+
+def test_allocations_never_exceed_the_budget() -> None:
+    demands = [37, 91, 12, 250, 64]
+    weights = [0.9, 0.2, 0.5, 0.7, 0.0]
+    for budget in [0, 1, 50, 200, 453, 1000]:
+        allocations = sources.allocate_budget(demands, weights, budget)
+        assert sum(allocations) <= budget
+        assert all(a <= d for a, d in zip(allocations, demands))
+
+
+def _source(url: str, score: float, words: int) -> dict:
+    content = " ".join(f"Sentence {i} about {url}." for i in range(words))
+    return {"url": url, "title": url, "content": content, "score": score}
+
+
+def test_fitted_sources_stay_within_the_budget() -> None:
+    found = [_source(f"https://example.com/{i}", 1.0 - i / 10, 60) for i in range(4)]
+
+    fitted = sources.fit_to_budget(
+        found, budget=300, max_tokens_per_source=200, include_raw_content=False
+    )
+
+    counts = [tokenizer.count_tokens(source["content"]) for source in fitted]
+    assert sum(counts) <= 300
+    assert all(count <= 200 for count in counts)
+    assert [source["url"] for source in fitted] == [s["url"] for s in found]
+
+
+def test_sources_starved_of_budget_are_dropped_least_relevant_first() -> None:
+    found = [
+        _source("https://example.com/best", 0.9, 60),
+        _source("https://example.com/good", 0.5, 60),
+        _source("https://example.com/worst", 0.1, 60),
+    ]
+
+    fitted = sources.fit_to_budget(
+        found,
+        budget=100,
+        max_tokens_per_source=200,
+        include_raw_content=False,
+        min_tokens_per_source=30,
+    )
+
+    assert [source["url"] for source in fitted] == [
+        "https://example.com/best",
+        "https://example.com/good",
+    ]
+
+
+def test_raw_content_shares_its_source_allocation() -> None:
+    found = [_source("https://example.com/page", 1.0, 5)]
+    found[0]["raw_content"] = "Raw text of the page. " * 100
+
+    (fitted,) = sources.fit_to_budget(
+        found, budget=1000, max_tokens_per_source=150, include_raw_content=True
+    )
+
+    content = tokenizer.count_tokens(fitted["content"])
+    raw = tokenizer.count_tokens(fitted["raw_content"])
+    assert content == tokenizer.count_tokens(found[0]["content"])
+    assert 0 < raw <= 150 - content
@@ -0,0 +1,116 @@
+import asyncio
+from typing import Any
+
+import pytest
+
+from docgen_agent import tools
+
+
+class CountingBackend:
+    """A search backend that answers after a short delay and counts its calls."""
+
+    def __init__(self) -> None:
+        self.queries: list[str] = []
+
+    async def search(self, query: str, **kwargs: Any) -> dict:
+        self.queries.append(query)
+        await asyncio.sleep(0.01)
+        return {"query": query, "results": [{"url": f"https://example.com/{query}"}]}
+
+
+@pytest.fixture
+def backend(monkeypatch: pytest.MonkeyPatch) -> CountingBackend:
+    backend = CountingBackend()
+    monkeypatch.setattr(tools, "search_backend", backend)
+    monkeypatch.setattr(tools, "search_cache", None)
+    return backend
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_searches_share_one_request(
+    backend: CountingBackend,
+) -> None:
+    coalesced = tools.search_stats.coalesced
+
+    responses = await asyncio.gather(
+        tools._search("GPU training", "general", None),
+        tools._search("  gpu   TRAINING ", "general", None),
+        tools._search("gpu training", "general", None),
+    )
+
+    assert backend.queries == ["gpu training"]
+    assert responses[0] == responses[1] == responses[2]
+    assert tools.search_stats.coalesced - coalesced == 2
+    assert not tools._in_flight
+
+
+@pytest.mark.asyncio
+async def test_different_searches_are_not_coalesced(backend: CountingBackend) -> None:
+    await asyncio.gather(
+        tools._search("gpu training", "general", None),
+        tools._search("gpu training", "news", 3),
+    )
+    assert len(backend.queries) == 2
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_cancel_the_shared_search(
+    backend: CountingBackend,
+) -> None:
+    first = asyncio.create_task(tools._search("gpu training", "general", None))
+    second = asyncio.create_task(tools._search("gpu training", "general", None))
+    await asyncio.sleep(0)
+    first.cancel()
+
+    response = await second
+
+    assert response["query"] == "gpu training"
+    assert backend.queries == ["gpu training"]
+
+
+@pytest.mark.asyncio
+async def test_failed_search_is_not_shared_with_later_callers(
+    backend: CountingBackend, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    async def fail(query: str, **kwargs: Any) -> dict:
+        raise ValueError("bad request")
+
+    monkeypatch.setattr(backend, "search", fail)
+    with pytest.raises(ValueError):
+        await tools._search("gpu training", "general", None)
+    monkeypatch.undo()
+    monkeypatch.setattr(tools, "search_backend", backend)
+    monkeypatch.setattr(tools, "search_cache", None)
+
+    response = await tools._search("gpu training", "general", None)
+    assert response["query"] == "gpu training"
+
+
+@pytest.mark.asyncio
+async def test_deadline_does_not_count_time_waiting_for_a_slot(
+    backend: CountingBackend, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    limiter = tools.AdaptiveRateLimiter(max_rate=1000, max_concurrency=1)
+    monkeypatch.setattr(tools, "search_limiter", limiter)
+    monkeypatch.setattr(tools, "SEARCH_DEADLINE", 0.025)
+
+    # Each search takes 10ms, but the last one only starts after 40ms.
+    queries = ["a", "b", "c", "d", "e"]
+    responses = await asyncio.gather(
+        *(tools._search(query, "general", None) for query in queries)
+    )
+
+    assert [response["query"] for response in responses] == queries
+
+
+@pytest.mark.asyncio
+async def test_search_past_the_deadline_is_given_up(
+    backend: CountingBackend, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(tools, "SEARCH_DEADLINE", 0.001)
+    timed_out = tools.search_stats.timed_out
+
+    with pytest.raises(TimeoutError):
+        await tools._search("gpu training", "general", None)
+
+    assert tools.search_stats.timed_out - timed_out == 1
@@ -0,0 +1,31 @@
+import asyncio
+
+import pytest
+
+from docgen_agent.transport import HTTPPool
+
+
+@pytest.mark.asyncio
+async def test_pool_stays_open_until_its_last_user_is_done() -> None:
+    http_pool = HTTPPool(size=4, hosts=1)
+    first_done = asyncio.Event()
+
+    async def first() -> None:
+        async with http_pool.use():
+            await http_pool.async_session().close()
+        first_done.set()
+
+    async def second() -> None:
+        async with http_pool.use():
+            await first_done.wait()
+            assert not connector.closed
+
+    async with http_pool.use():
+        connector = http_pool._connector(True)
+    assert connector.closed
+
+    connector = http_pool._connector(True)
+    await asyncio.gather(second(), first())
+
+    assert connector.closed
+    assert not http_pool._connectors
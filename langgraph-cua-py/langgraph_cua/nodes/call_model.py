@@ -1,11 +1,14 @@
-from typing import Any, Dict, Optional, Union
+import functools
+from typing import TYPE_CHECKING, Any, Dict, Optional, Union
 
 from langchain_core.messages import AIMessageChunk, SystemMessage
 from langchain_core.runnables.config import RunnableConfig
-from langchain_openai import ChatOpenAI
 
 from ..types import CUAState, get_configuration_with_defaults
 
+if TYPE_CHECKING:
+    from langchain_openai import ChatOpenAI
+
 
 def get_openai_env_from_state_env(env: str) -> str:
     """
@@ -33,6 +36,17 @@ DEFAULT_DISPLAY_WIDTH = 1024
 DEFAULT_DISPLAY_HEIGHT = 768
 
 
+@functools.lru_cache(maxsize=None)
+def _get_llm() -> "ChatOpenAI":
+    """
+    Gets the computer preview model. It is created on first use and shared
+    across calls, so its HTTP connections are reused.
+    """
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(model="computer-use-preview", model_kwargs={"truncation": "auto"})
+
+
 def _prompt_to_sys_message(prompt: Union[str, SystemMessage, None]):
     if prompt is None:
         return None
@@ -69,18 +83,13 @@ async def call_model(state: CUAState, config: RunnableConfig) -> Dict[str, Any]:
         ):
             previous_response_id = messages[-2].response_metadata["id"]
 
-    llm = ChatOpenAI(
-        model="computer-use-preview",
-        model_kwargs={"truncation": "auto", "previous_response_id": previous_response_id},
-    )
-
     tool = {
         "type": "computer_use_preview",
         "display_width": DEFAULT_DISPLAY_WIDTH,
         "display_height": DEFAULT_DISPLAY_HEIGHT,
         "environment": get_openai_env_from_state_env(environment),
     }
-    llm_with_tools = llm.bind_tools([tool])
+    llm_with_tools = _get_llm().bind_tools([tool], previous_response_id=previous_response_id)
 
     response: AIMessageChunk
 